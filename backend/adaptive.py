@@ -0,0 +1,175 @@
+# adaptive.py
+from bisect import bisect_left
+
+import numpy as np
+
+from frames import sample_frames, frames_at
+from pipeline import PoseStream, landmark_rows, expected_samples, DEFAULT_LONG_SIDE
+from utils import pose_array
+
+def find_extremes(values, kind="min", min_prominence=5.0):
+    """
+    Positions of local extremes in a 1-D signal (e.g. knee angle per sample).
+
+    kind is "min", "max" or "both". A sample counts if it is <= (>=) both
+    neighbours and stands out by min_prominence from the lower of the two
+    peaks (troughs) the signal climbs to on either side, which keeps jitter
+    on flat stretches from triggering refinement while a bottom that falls
+    between two near-equal samples still counts. The clip ends count as
+    extremes too (measured against their one side), so a rep cut off at the
+    bottom is still refined.
+    """
+    v = np.asarray(values, dtype=float)
+    n = len(v)
+    if n < 3:
+        return list(range(n))
+    out = []
+    for sign, want in ((1.0, "min"), (-1.0, "max")):
+        if kind not in (want, "both"):
+            continue
+        s = (sign * v).tolist()
+        for i in range(n):
+            if (i and s[i] > s[i - 1]) or (i < n - 1 and s[i] > s[i + 1]):
+                continue
+            peaks = []
+            for step in (-1, 1):
+                j = i
+                while 0 <= j + step < n and s[j + step] >= s[j]:
+                    j += step
+                if j != i:
+                    peaks.append(s[j])
+            if peaks and min(peaks) - s[i] >= min_prominence:
+                out.append(i)
+    return sorted(set(out))
+
+def refine_indices(extreme_frames, coarse_step, stride, sampled):
+    """Frame indices at `stride` spacing within ±coarse_step of each extreme, minus ones already sampled."""
+    wanted = set()
+    for f in extreme_frames:
+        lo = max(0, f - coarse_step + stride)
+        wanted.update(range(lo, f + coarse_step, stride))
+    return sorted(wanted - set(sampled))
+
+def nearest(sorted_values, x):
+    """Position in sorted_values (non-empty) of the entry closest to x."""
+    i = bisect_left(sorted_values, x)
+    if i == len(sorted_values) or (i and x - sorted_values[i - 1] <= sorted_values[i] - x):
+        return i - 1
+    return i
+
+def spacing_weights(frames, stride):
+    """
+    Weight of each sample in sorted `frames` (all on the `stride` grid): the
+    span from halfway to the previous sample to halfway to the next one, in
+    half strides, so uniform sampling at `stride` weighs every sample 2 and
+    a coarse sample stands for the base-stride samples it replaces. The clip
+    ends count their one gap twice.
+    """
+    f = np.asarray(frames, dtype=np.int64)
+    if len(f) < 2:
+        return [2] * len(f)
+    gaps = np.diff(f) // max(1, int(stride))
+    return np.maximum(np.concatenate(([2 * gaps[0]], gaps[:-1] + gaps[1:], [2 * gaps[-1]])), 1).tolist()
+
+def run_adaptive_pose_pipeline(cap, pose, on_frame, signal, on_extreme, stride=3, coarse_factor=4,
+                               extreme="min", max_frames=600, queue_size=8,
+                               long_side=DEFAULT_LONG_SIDE, frame_size=(1, 1), progress=None):
+    """
+    Coarse-to-fine variant of run_pose_pipeline.
+
+    Pass 1 samples every stride*coarse_factor frames and records
+    signal(landmarks) (the knee/elbow angle) for each detection. Pass 2
+    seeks back and re-samples at the base stride only inside windows around
+    the signal's local extremes. Once both passes are done, on_frame(landmarks,
+    weight) gets every detection of either pass in frame order, weight being
+    its spacing_weights() share, so summaries come out as under uniform
+    sampling at the base stride: dense near the extremes, held between
+    coarse samples elsewhere. Each refined sample also counts towards the
+    extreme it is nearest, and on_extreme(value) then gets every extreme's
+    value at base-stride resolution, in frame order (the per-rep bottoms for
+    extreme="min"). max_frames caps inference calls across both passes
+    (None: no cap). landmarks are (33, 4) arrays as in run_pose_pipeline.
+    progress(done, total) counts inference calls; total is the coarse
+    pass's expected samples until pass 2's size is known. Returns merged
+    PoseStream stats plus pass counts.
+    """
+    coarse_step = max(1, int(stride)) * max(1, int(coarse_factor))
+    sampled, sig_frames, sig_values, detections = [], [], [], []
+    w, h = frame_size
+    rows = landmark_rows()
+    total = expected_samples(cap, coarse_step, max_frames, False) if progress is not None else None
+    counts = {"decoded": 0}
+
+    stream = PoseStream(sample_frames(cap, coarse_step, counts=counts), pose, queue_size=queue_size, long_side=long_side)
+    try:
+        for idx, res in stream:
+            sampled.append(idx)
+            if res.pose_landmarks:
+                lms = pose_array(res.pose_landmarks, w, h, out=next(rows))
+                detections.append((idx, lms))
+                value = signal(lms)
+                if value is not None:
+                    sig_frames.append(idx); sig_values.append(value)
+            if progress is not None:
+                progress(len(sampled), total)
+            if max_frames is not None and len(sampled) >= max_frames:
+                break
+    finally:
+        stream.close()
+    coarse_stats = stream.stats()
+
+    kinds = ("min", "max") if extreme == "both" else (extreme,)
+    extremes = sorted((sig_frames[i], kind, sig_values[i])
+                      for kind in kinds for i in find_extremes(sig_values, kind=kind))
+    frames = [f for f, _, _ in extremes]
+    best = [v for _, _, v in extremes]
+    todo = refine_indices(frames, coarse_step, stride, sampled)
+    if max_frames is not None:
+        todo = todo[:max(0, max_frames - len(sampled))]
+
+    refine_stats = {}
+    refined = []
+    if todo:
+        stream = PoseStream(frames_at(cap, todo, counts=counts), pose, queue_size=queue_size, long_side=long_side)
+        try:
+            for idx, res in stream:
+                refined.append(idx)
+                if progress is not None:
+                    progress(len(sampled) + len(refined), len(sampled) + len(todo))
+                if res.pose_landmarks:
+                    lms = pose_array(res.pose_landmarks, w, h, out=next(rows))
+                    detections.append((idx, lms))
+                    value = signal(lms)
+                    if value is not None:
+                        j = nearest(frames, idx)
+                        if (value < best[j]) if extremes[j][1] == "min" else (value > best[j]):
+                            best[j] = value
+        finally:
+            stream.close()
+        refine_stats = stream.stats()
+
+    # Weights come from every sample taken, detected or not.
+    all_frames = sorted(sampled + refined)
+    weight = dict(zip(all_frames, spacing_weights(all_frames, stride)))
+    for idx, lms in sorted(detections, key=lambda d: d[0]):
+        on_frame(lms, weight[idx])
+    if on_extreme is not None:
+        for value in best:
+            on_extreme(value)
+
+    stats = dict(coarse_stats)
+    for k, v in refine_stats.items():
+        if k.endswith("_s") or k in ("sampled", "inferred"):
+            stats[k] += v
+        elif k == "max_queue_depth":
+            stats[k] = max(stats[k], v)
+    stats.update({
+        "sampling": "adaptive",
+        "coarse_step": coarse_step,
+        "coarse_inferred": coarse_stats["inferred"],
+        "refine_inferred": len(refined),
+        "extremes": len(extremes),
+        "processed": len(sampled) + len(refined),
+        "decoded": counts["decoded"],
+    })
+    return stats
@@ -0,0 +1,142 @@
+# admission.py
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from pose_pool import POOL_SIZE
+
+# Analyses running at once, how many more may wait for a slot, and for how
+# long, before being turned away. Upload analyses, background jobs and live
+# sessions all take slots and all draw from the one Pose pool, so there are
+# never more slots than pooled instances: an admitted analysis never waits
+# for a Pose.
+ANALYZE_CONCURRENCY = min(int(os.environ.get("ANALYZE_CONCURRENCY", 0)) or POOL_SIZE, POOL_SIZE)
+ANALYZE_QUEUE = int(os.environ.get("ANALYZE_QUEUE", 2 * ANALYZE_CONCURRENCY))
+ANALYZE_QUEUE_WAIT_S = float(os.environ.get("ANALYZE_QUEUE_WAIT_S", 30))
+# Running + waiting analyses per client; 0 = no cap.
+ANALYZE_PER_CLIENT = int(os.environ.get("ANALYZE_PER_CLIENT", 0))
+
+class Overloaded(Exception):
+    """Request turned away: HTTP `status` (429 or 503) with a Retry-After of `retry_after` seconds."""
+
+    def __init__(self, message, status=503, retry_after=1):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class Admission:
+    """
+    Bounded concurrency with a bounded FIFO wait queue.
+
+    slot(client) runs its body once fewer than `limit` slots are taken,
+    waiting in arrival order behind at most `queue_size` others. It raises
+    Overloaded(503) when the queue is full or the wait exceeds max_wait_s
+    (or the slot's own, shorter max_wait_s), and Overloaded(429) when `client` already has per_client analyses
+    running or waiting. check(client) applies the same rejections without
+    taking a place, so a request can be refused before its upload is read.
+    Retry-After is estimated from the recent service time and queue length;
+    slot(timed=False) keeps a long-lived holder (a live session) out of
+    that estimate.
+    """
+
+    def __init__(self, limit=ANALYZE_CONCURRENCY, queue_size=ANALYZE_QUEUE, max_wait_s=ANALYZE_QUEUE_WAIT_S,
+                 per_client=ANALYZE_PER_CLIENT):
+        self.limit = max(1, int(limit))
+        self.queue_size = max(0, int(queue_size))
+        self.max_wait_s = max_wait_s
+        self.per_client = per_client
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiters = deque()
+        self._clients = Counter()
+        self._service_s = None
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_client": 0,
+                       "timed_out": 0, "wait_s": 0.0, "max_wait_s": 0.0, "max_queue_depth": 0}
+
+    def retry_after(self):
+        per_slot = self._service_s if self._service_s is not None else 10.0
+        return int(min(60, max(1, math.ceil(per_slot * (len(self._waiters) + 1) / self.limit))))
+
+    def _reject(self, client):
+        if self.per_client and client is not None and self._clients[client] >= self.per_client:
+            self._stats["rejected_client"] += 1
+            raise Overloaded("Too many analyses in progress for this client.", 429, self.retry_after())
+        if self._running >= self.limit and len(self._waiters) >= self.queue_size:
+            self._stats["rejected_queue_full"] += 1
+            raise Overloaded("Server busy, try again shortly.", 503, self.retry_after())
+
+    def available(self):
+        """Whether slot() would start at once (no queueing)."""
+        with self._lock:
+            return self._running < self.limit and not self._waiters
+
+    def check(self, client=None):
+        with self._lock:
+            self._reject(client)
+
+    @contextmanager
+    def slot(self, client=None, max_wait_s=None, timed=True):
+        self._acquire(client, max_wait_s)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(client, time.perf_counter() - t0 if timed else None)
+
+    def _acquire(self, client, max_wait_s=None):
+        with self._lock:
+            self._reject(client)
+            self._clients[client] += 1
+            if self._running < self.limit and not self._waiters:
+                self._running += 1
+                self._stats["admitted"] += 1
+                return
+            waiter = [threading.Event(), False]   # [wake-up, slot handed over]
+            self._waiters.append(waiter)
+            self._stats["queued"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+        t0 = time.perf_counter()
+        waiter[0].wait(self.max_wait_s if max_wait_s is None else min(self.max_wait_s, max_wait_s))
+        waited = time.perf_counter() - t0
+        with self._lock:
+            self._stats["wait_s"] += waited
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], waited)
+            if not waiter[1]:
+                self._waiters.remove(waiter)
+                self._drop_client(client)
+                self._stats["timed_out"] += 1
+                raise Overloaded("Server busy, try again shortly.", 503, self.retry_after())
+            self._stats["admitted"] += 1
+
+    def _release(self, client, service_s):
+        with self._lock:
+            self._drop_client(client)
+            if service_s is not None:
+                self._service_s = service_s if self._service_s is None else 0.8 * self._service_s + 0.2 * service_s
+            if self._waiters:
+                # hand the slot straight to the longest waiter
+                waiter = self._waiters.popleft()
+                waiter[1] = True
+                waiter[0].set()
+            else:
+                self._running -= 1
+
+    def _drop_client(self, client):
+        self._clients[client] -= 1
+        if self._clients[client] <= 0:
+            del self._clients[client]
+
+    def stats(self):
+        with self._lock:
+            st = dict(self._stats)
+            st.update(running=self._running, queue_depth=len(self._waiters), limit=self.limit,
+                      queue_size=self.queue_size, per_client=self.per_client,
+                      clients=len(self._clients),
+                      service_s=round(self._service_s, 3) if self._service_s is not None else None,
+                      retry_after=self.retry_after())
+        return st
+
+ADMISSION = Admission()
@@ -0,0 +1,284 @@
+# analysis.py
+import queue
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import (run_pose_pipeline, replay_covers, replay_landmarks, sampling_stride, video_fps,
+                      DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES)
+from adaptive import run_adaptive_pose_pipeline
+from progressive import run_progressive_pose_pipeline
+from pose_pool import POSE_POOL
+from landmark_cache import LANDMARK_CACHE
+
+# Landmark rows an analyzer buffers before turning them into metrics.
+CHUNK_FRAMES = 256
+
+class MetricStream:
+    """
+    Per-frame metrics folded into constant-memory summaries.
+
+    add(landmarks) buffers rows; every `chunk` rows (and on flush()) they are
+    stacked, metrics_fn turns them into {name: 1-D array} in one batch call,
+    and each array is fed to stats[name] (a StreamingQuantile, Welford, ...).
+    add(landmarks, weight) buffers the row `weight` times, which is how an
+    adaptive pass (adaptive.py) weights samples by their spacing. Metrics
+    without a summary are dropped. acc[name] is the summary; acc.count is
+    the number of add() calls so far and acc.seconds the time spent
+    computing and summarizing metrics.
+    """
+
+    def __init__(self, metrics_fn, stats, chunk=CHUNK_FRAMES):
+        self.metrics_fn = metrics_fn
+        self.stats = stats
+        self.chunk = chunk
+        self.count = 0
+        self.seconds = 0.0
+        self._rows = []
+
+    def __getitem__(self, name):
+        return self.stats[name]
+
+    def add(self, landmarks, weight=1):
+        self.count += 1
+        self._rows.extend([landmarks] * weight)
+        if len(self._rows) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        t0 = time.perf_counter()
+        metrics = self.metrics_fn(np.stack(self._rows))
+        self._rows = []
+        for name, stat in self.stats.items():
+            stat.update(metrics[name])
+        self.seconds += time.perf_counter() - t0
+
+def finish_report(report, acc, size, stats=None):
+    """
+    report(acc, size) for a finished pass, adding geometry_s (acc.seconds),
+    score_s (the report itself) and detected (rows fed to acc) to stats.
+    With several accumulators the times add up and detected is the largest.
+    """
+    acc.flush()
+    t0 = time.perf_counter()
+    result = report(acc, size)
+    if stats is not None:
+        stats["geometry_s"] = stats.get("geometry_s", 0.0) + acc.seconds
+        stats["score_s"] = stats.get("score_s", 0.0) + time.perf_counter() - t0
+        stats["detected"] = max(stats.get("detected", 0), acc.count)
+    return result
+
+def add_rep_bottoms(report, section, bottoms):
+    """
+    Attach an adaptive pass's refined per-rep bottoms (its on_extreme
+    values) to report["detailed_breakdown"][section] as "rep_bottoms".
+    The section's score comes from the accumulator, which saw both passes.
+    """
+    if bottoms and "error" not in report:
+        report["detailed_breakdown"][section]["rep_bottoms"] = [round(float(v), 1) for v in bottoms]
+    return report
+
+class FanOut:
+    """
+    Hands one pose pass to several analyzers.
+
+    consumers is [(on_frame, limit_detections), ...]. sample(idx, landmarks)
+    is the pipeline's on_sample; it applies each consumer's own max_frames
+    semantics (see run_pose_pipeline), so every analyzer sees exactly the
+    samples a pass of its own would. The pass itself has to run with
+    `limit_detections` (detections run out no sooner than samples).
+    """
+
+    def __init__(self, consumers, max_frames):
+        self.max_frames = max_frames
+        self.limit_detections = any(limit for _, limit in consumers)
+        self._subs = [[on_frame, limit, 0] for on_frame, limit in consumers]
+
+    def sample(self, idx, landmarks):
+        for sub in self._subs:
+            on_frame, limit, processed = sub
+            if self.max_frames is not None and processed >= self.max_frames:
+                continue
+            if landmarks is not None or not limit:
+                sub[2] += 1
+            if landmarks is not None:
+                on_frame(landmarks)
+
+def _open(video_path, stats):
+    """(cap, width, height, fps), or None if the video cannot be opened; records open_s in stats."""
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    stats["open_s"] = time.perf_counter() - t0
+    if not cap.isOpened():
+        return None
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1920)
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1080)
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+    return cap, w, h, fps
+
+def _sampling(cap, stride, sample_hz, max_samples, stats):
+    """The frame stride for a pass (stride itself, or from sample_hz / max_samples); records it in stats."""
+    if stride is None:
+        stride = sampling_stride(cap, sample_hz, max_samples)
+    stats["stride"] = stride
+    stats["sample_hz"] = round(video_fps(cap) / stride, 3)
+    return stride
+
+def run_pose_pass(video_path, on_frame, stride=None, max_frames=None, limit_detections=True,
+                  long_side=DEFAULT_LONG_SIDE, sampling="uniform", signal=None, on_extreme=None,
+                  digest=None, stats=None, progress=None, sample_hz=SAMPLE_HZ, max_samples=MAX_SAMPLES):
+    """
+    The pose pass shared by every analyzer.
+
+    Calls on_frame(landmarks) per detected sample, landmarks being a (33, 4)
+    float32 array in pixels of the original frame (utils.pose_array). Samples
+    are taken at sample_hz, with at most max_samples inference calls (see
+    pipeline.sampling_stride); an explicit frame `stride` overrides
+    sample_hz. stats gets the stride, the effective sample_hz and
+    `truncated` (a clip of unknown length ran out of budget). Uniform
+    sampling goes through the landmark cache when `digest` (the video's
+    sha256, or a callable returning it once known) is given: a covering
+    entry is replayed without opening the video, otherwise the pass is
+    recorded and stored. sampling="adaptive" uses signal(landmarks)
+    and on_extreme(value) as described in adaptive.py, calls
+    on_frame(landmarks, weight) and is not cached; its stats report the
+    coarse pass's rate as sample_hz and the refinement's as refine_sample_hz.
+    max_frames additionally caps frames as in run_pose_pipeline (None, the
+    default, leaves only the budget). progress(done, total) reports
+    samples as in run_pose_pipeline (a cache hit reports once, when done);
+    an exception it raises abandons the pass, releasing the capture and the
+    Pose instance. Returns (width, height), or None if the video cannot be
+    opened.
+    """
+    if sampling != "adaptive":
+        return run_shared_pose_pass(video_path, [(on_frame, limit_detections)], stride=stride,
+                                    max_frames=max_frames, long_side=long_side, digest=digest, stats=stats,
+                                    progress=progress, sample_hz=sample_hz, max_samples=max_samples)
+    stats = {} if stats is None else stats
+    opened = _open(video_path, stats)
+    if opened is None:
+        return None
+    cap, w, h, _ = opened
+    stride = _sampling(cap, stride, sample_hz, max_samples, stats)
+    fps = video_fps(cap)
+    # the adaptive pipeline's max_frames already caps inference calls
+    budget = [n for n in (max_frames, max_samples) if n is not None]
+    try:
+        with POSE_POOL.checkout() as pose:
+            stats.update(run_adaptive_pose_pipeline(
+                cap, pose, on_frame, signal, on_extreme,
+                stride=stride, max_frames=min(budget) if budget else None, long_side=long_side,
+                frame_size=(w, h), progress=progress))
+    finally:
+        cap.release()
+    stats.update(sample_hz=round(fps / stats["coarse_step"], 3), refine_sample_hz=stats["sample_hz"])
+    return w, h
+
+def run_shared_pose_pass(video_path, consumers, stride=None, max_frames=None, long_side=DEFAULT_LONG_SIDE,
+                         digest=None, stats=None, progress=None, on_open=None, sample_hz=SAMPLE_HZ,
+                         max_samples=MAX_SAMPLES, deadline=None):
+    """
+    One uniform pose pass (decode + inference once) feeding several analyzers.
+
+    consumers is [(on_frame, limit_detections), ...] as in FanOut; caching,
+    progress and the return value are as in run_pose_pass. on_open(width,
+    height) is called once the frame size is known, before the first sample.
+
+    deadline, a time.perf_counter() value, makes the pass anytime: it stops
+    there and the analyzers get what was sampled so far, in frame order.
+    Clips of known length are sampled coarse to fine (progressive.py), so
+    that is spread over the whole clip; others are read from the start.
+    stats then gets coverage (share of the planned samples taken, None when
+    unknown), span (share of the clip reached), deadline_hit and, for
+    progressive passes, read_failed (see progressive.py). Waiting
+    for a pooled Pose counts against the deadline too; if none frees up in
+    time the analyzers get no samples. Passes cut short are not cached.
+    """
+    stats = {} if stats is None else stats
+    if callable(digest) and digest() is not None:
+        digest = digest()
+    use_cache = LANDMARK_CACHE.enabled and digest is not None
+    params = {"stride": stride, "sample_hz": None if stride else sample_hz, "max_samples": max_samples,
+              "long_side": long_side}
+
+    if use_cache and not callable(digest):
+        entry = LANDMARK_CACHE.get(LANDMARK_CACHE.key(digest, **params))
+        if entry is not None and all(replay_covers(entry.detected, entry.meta["complete"], max_frames, limit)
+                                     for _, limit in consumers):
+            if on_open is not None:
+                on_open(entry.width, entry.height)
+            processed = max(replay_landmarks(entry.landmarks, entry.detected, on_frame, max_frames, limit)
+                            for on_frame, limit in consumers)
+            stats.update({"cache": "hit", "processed": processed,
+                          "truncated": bool(entry.meta.get("truncated"))})
+            if entry.meta.get("stride"):
+                stats.update(stride=entry.meta["stride"], sample_hz=entry.meta.get("sample_hz"))
+            if deadline is not None:
+                stats.update(coverage=1.0, span=1.0, deadline_hit=False)
+            if progress is not None:
+                progress(processed, processed)
+            return entry.width, entry.height
+
+    opened = _open(video_path, stats)
+    if opened is None:
+        return None
+    cap, w, h, fps = opened
+    stride = _sampling(cap, stride, sample_hz, max_samples, stats)
+    if on_open is not None:
+        on_open(w, h)
+    fan = FanOut(consumers, max_frames)
+    record = [] if use_cache else None
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    progressive = deadline is not None and n_frames > 0
+
+    def on_sample(idx, landmarks):
+        if not progressive:
+            fan.sample(idx, landmarks)
+        if record is not None:
+            record.append((idx, landmarks))
+
+    if progressive and record is None:
+        record = []
+    wait = None if deadline is None else max(0.0, deadline - time.perf_counter())
+    try:
+        with POSE_POOL.checkout(timeout=wait) as pose:
+            if progressive:
+                run_stats = run_progressive_pose_pipeline(
+                    cap, pose, on_sample, n_frames, deadline,
+                    stride=stride, long_side=long_side, frame_size=(w, h), progress=progress)
+            else:
+                run_stats = run_pose_pipeline(
+                    cap, pose, None,
+                    stride=stride, max_frames=max_frames, limit_detections=fan.limit_detections,
+                    long_side=long_side, frame_size=(w, h), on_sample=on_sample, progress=progress,
+                    max_samples=max_samples, deadline=deadline)
+    except queue.Empty:
+        # No Pose came free before the deadline: nothing was sampled.
+        run_stats = {"processed": 0, "deadline_hit": True, "eof": False, "truncated": False,
+                     "coverage": 0.0 if progressive else None, "span": 0.0}
+    finally:
+        cap.release()
+    stats.update(run_stats)
+    if progressive:
+        record.sort(key=lambda sample: sample[0])
+        for idx, landmarks in record:
+            fan.sample(idx, landmarks)
+        if not use_cache:
+            record = None
+    elif deadline is not None and "span" not in run_stats:
+        hit = run_stats["deadline_hit"]
+        stats.update(coverage=None if hit else 1.0, span=None if hit else 1.0)
+
+    if record is not None and not run_stats["deadline_hit"]:
+        # Streamed uploads only know their hash after the last byte.
+        key_digest = digest() if callable(digest) else digest
+        if key_digest:
+            # a pass that ran out of budget is all this policy will ever sample
+            LANDMARK_CACHE.put(LANDMARK_CACHE.key(key_digest, **params), record, w, h, fps,
+                               complete=run_stats["eof"] or run_stats["truncated"],
+                               truncated=run_stats["truncated"], stride=stride, sample_hz=stats["sample_hz"])
+            stats["cache"] = "stored"
+    return w, h
@@ -1,54 +1,885 @@
 # app.py
+import hashlib
+import json
 import os
+import queue
 import tempfile
-from flask import Flask, request, jsonify
+import threading
+import time
+
+import numpy as np
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+try:
+    # Live camera mode (/api/live) needs WebSockets.
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 from squat import analyze_squat_video
 from pushup import analyze_pushup_video
 from lunge import analyze_lunge_video   # ⬅️ add this
+from exercises import EXERCISES, PARTIAL_INTERVAL_S, parse_exercise_types, analyze_exercises, analyze_landmarks
+from ingest import stream_upload, UploadError, CAN_STREAM
+from pose_pool import POSE_POOL
+from pipeline import DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES
+from landmark_cache import LANDMARK_CACHE, file_digest
+from result_cache import RESULT_CACHE, Uncacheable
+from admission import ADMISSION, Overloaded
+from metrics import METRICS
+from profiling import ProfileDenied, check_profile, run_profiled, stage_times
+from cancel import CancelToken, Cancelled, marker_path, request_cancel, valid_request_id
+from jobs import JobQueue
+from live import LiveSession, parse_live_config, serve_live, live_stats
+from landmark_track import MAGIC as TRACK_MAGIC, N_LANDMARKS, parse_track
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 ALLOWED_EXT = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+SAMPLING_MODES = ("uniform", "adaptive")
+UNSUPPORTED_EXERCISE = "Exercise '{}' not supported. Try 'squat', 'pushup', 'lunge' or 'all'."
 
-@app.route("/api/analyze", methods=["POST"])
-def analyze():
-    if "video" not in request.files:
-        return jsonify({"error": "Missing 'video' file field"}), 400
+# Per-client admission limits key on X-Forwarded-For's first hop only behind a trusted proxy.
+TRUST_PROXY = os.environ.get("TRUST_PROXY", "0") == "1"
+
+# Landmark uploads (/api/analyze/landmarks) carry at most this many samples.
+MAX_TRACK_SAMPLES = int(os.environ.get("MAX_TRACK_SAMPLES", 20000))
+_ROW_BYTES = N_LANDMARKS * 4 * 4
+
+# deadline_ms minus this is when a deadline run stops sampling; the rest
+# covers scoring and sending the report.
+DEADLINE_RESERVE_MS = int(os.environ.get("DEADLINE_RESERVE_MS", 100))
+
+# How long a live connection waits for an admission slot (and then a free
+# Pose instance) before giving up.
+LIVE_POSE_WAIT_S = float(os.environ.get("LIVE_POSE_WAIT_S", 2.0))
+
+# Decode/infer while the upload is still arriving (POSIX only: needs a FIFO).
+STREAM_UPLOADS = CAN_STREAM and os.environ.get("STREAM_UPLOADS", "1") != "0"
+
+def run_analysis(exercise_type, video_path, sampling="uniform", digest=None, progress=None, on_partial=None,
+                 stats=None, deadline=None):
+    # Simple dispatcher; "all" or "squat,lunge" share one pose pass
+    t0 = time.perf_counter()
+    stats = {} if stats is None else stats
+    names = parse_exercise_types(exercise_type)
+    if len(names) > 1:
+        return run_multi_analysis(names, video_path, sampling, digest, progress, on_partial, stats, deadline)
+    exercise_type = names[0] if names else exercise_type
+    if deadline is not None and sampling != "uniform":
+        return {"error": "deadline_ms needs uniform sampling."}
+    kwargs = {"stats": stats, "sampling": sampling, "digest": digest, "progress": progress}
+    if (on_partial is not None or deadline is not None) and sampling == "uniform" and exercise_type in EXERCISES:
+        # provisional reports and deadlines come from the shared pass; the final report is the same
+        result = analyze_exercises(video_path, [exercise_type], stats=stats, digest=digest,
+                                   progress=progress, on_partial=on_partial, deadline=deadline)[exercise_type]
+    elif exercise_type == "squat":
+        result = analyze_squat_video(video_path, **kwargs)
+    elif exercise_type == "pushup":
+        result = analyze_pushup_video(video_path, **kwargs)
+    elif exercise_type == "lunge":                     # ⬅️ add this
+        result = analyze_lunge_video(video_path, **kwargs)
+    else:
+        return {"error": UNSUPPORTED_EXERCISE.format(exercise_type)}
+    if stats:
+        app.logger.info("analyze %s pipeline: %s", exercise_type, stats)
+    add_sampling(result, sampling, stats)
+    add_confidence(result, stats)
+    METRICS.observe_analysis(exercise_type, stats, time.perf_counter() - t0, error="error" in result)
+    return result
+
+def run_multi_analysis(names, video_path, sampling, digest, progress=None, on_partial=None, stats=None,
+                       deadline=None):
+    unknown = [name for name in names if name not in EXERCISES]
+    if unknown:
+        return {"error": UNSUPPORTED_EXERCISE.format(unknown[0])}
+    if sampling != "uniform":
+        return {"error": "Adaptive sampling analyzes one exercise at a time."}
+    t0 = time.perf_counter()
+    stats = {} if stats is None else stats
+    reports = analyze_exercises(video_path, names, stats=stats, digest=digest,
+                                progress=progress, on_partial=on_partial, deadline=deadline)
+    if stats:
+        app.logger.info("analyze %s pipeline: %s", ",".join(names), stats)
+    result = {"reports": reports}
+    errors = [r["error"] for r in reports.values() if "error" in r]
+    if len(errors) == len(reports):
+        result["error"] = errors[0]
+    add_sampling(result, sampling, stats)
+    add_confidence(result, stats)
+    METRICS.observe_analysis(",".join(names), stats, time.perf_counter() - t0, error="error" in result)
+    return result
+
+def add_sampling(result, sampling, stats):
+    """Tell the client how densely the clip was sampled and whether the inference budget cut it short."""
+    if "error" not in result and "sample_hz" in stats:
+        result["sampling"] = {"mode": sampling, "sample_hz": stats["sample_hz"],
+                              "truncated": bool(stats.get("truncated"))}
+        if "refine_sample_hz" in stats:
+            result["sampling"]["refine_sample_hz"] = stats["refine_sample_hz"]
+
+def add_confidence(result, stats):
+    """
+    For deadline runs: how much of the clip the (possibly partial) result
+    rests on. coverage is the share of the planned samples analyzed (None
+    if the clip's length is unknown), span the share of the clip reached.
+    A partial result says why in "reason": "deadline", or "unreadable" when
+    the pass ended in time but frames could not be read (progressive.py).
+    """
+    if "coverage" not in stats:
+        return
+    reason = "deadline" if stats.get("deadline_hit") else "unreadable" if stats.get("read_failed") else None
+    if "error" in result and reason == "deadline":
+        result["error"] = "The deadline passed before enough of the video was analyzed."
+    result["confidence"] = {"coverage": stats["coverage"], "span": stats.get("span"), "complete": reason is None}
+    if reason is not None:
+        result["confidence"]["reason"] = reason
+
+def analysis_key(exercise_type, sampling, digest):
+    names = parse_exercise_types(exercise_type)
+    return RESULT_CACHE.key(digest, exercise_type=",".join(names) or exercise_type, sampling=sampling,
+                            sample_hz=SAMPLE_HZ, max_samples=MAX_SAMPLES, long_side=DEFAULT_LONG_SIDE)
+
+def cancel_token():
+    """
+    CancelToken for this request: trips when the client disconnects or
+    POSTs /api/analyze/cancel/<id> for the X-Request-Id it sent.
+    """
+    sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    request_id = request.headers.get("X-Request-Id")
+    marker = marker_path(client_id(), request_id) if valid_request_id(request_id) else None
+    return CancelToken(sock, marker)
+
+def client_id():
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+def admitted_analysis(client, *args, **kwargs):
+    """run_analysis inside an ADMISSION slot; raises Overloaded."""
+    deadline = kwargs.get("deadline")
+    wait = None if deadline is None else max(0.0, deadline - time.perf_counter())
+    with ADMISSION.slot(client, max_wait_s=wait):
+        return run_analysis(*args, **kwargs)
+
+def cached_analysis(exercise_type, video_path, sampling, digest, progress=None, on_partial=None, client=None,
+                    deadline=None, cancel=None):
+    """
+    run_analysis through RESULT_CACHE: identical requests (same upload hash
+    and parameters) share one computation, and only that one takes an
+    admission slot (see admitted_analysis). Returns (result, key, source);
+    key is None when the digest is unknown. A deadline run takes a stored
+    report but neither joins nor waits on another computation; only a run
+    that finished in time is stored, and its key is never returned (its
+    report differs by the confidence section). A tripped `cancel` token
+    (cancel.py) stops the run with Cancelled; requests that had joined it
+    compute their own report instead.
+    """
+    if cancel is not None:
+        progress = cancel.watch(progress)
+    args = (exercise_type, video_path, sampling, digest, progress, on_partial)
+    if deadline is not None:
+        key = analysis_key(exercise_type, sampling, digest) if digest is not None else None
+        result = RESULT_CACHE.get(key) if key is not None else None
+        if result is not None:
+            return dict(result, confidence={"coverage": 1.0, "span": 1.0, "complete": True}), None, "hit"
+        result = admitted_analysis(client, *args, deadline=deadline)
+        if key is not None and "error" not in result and result.get("confidence", {}).get("complete"):
+            RESULT_CACHE.put(key, {k: v for k, v in result.items() if k != "confidence"})
+        return result, None, "deadline"
+    if digest is None:
+        return admitted_analysis(client, *args), None, "uncached"
+    key = analysis_key(exercise_type, sampling, digest)
+    result, source = shared_run(key, lambda: admitted_analysis(client, *args), cancel)
+    if source != "computed":
+        app.logger.info("analyze %s result: %s", exercise_type, source)
+    return result, key, source
+
+def shared_run(key, compute, cancel=None):
+    """RESULT_CACHE.run(key, compute), computing anew if the run it joined was cancelled by its own client."""
+    while True:
+        try:
+            return RESULT_CACHE.run(key, compute)
+        except Cancelled:
+            if cancel is not None and cancel.cancelled:
+                raise
+
+def profiled_analysis(client, exercise_type, video_path, sampling):
+    """
+    run_analysis under the profiler (profiling.py) with the report's
+    "profile" section attached. It skips the result and landmark caches, so
+    the profile covers a full decode + inference pass.
+    """
+    stats = {}
+    with ADMISSION.slot(client):
+        result, profile = run_profiled(exercise_type, run_analysis, exercise_type, video_path, sampling,
+                                       stats=stats)
+    profile["stages"] = stage_times(stats)
+    app.logger.info("profiled %s: %s", exercise_type, profile["dump"])
+    return dict(result, profile=profile)
+
+def result_headers(key):
+    return {"ETag": RESULT_CACHE.etag(key), "Content-Location": f"/api/results/{key}"}
+
+def not_modified(key):
+    """A 304 if the request's If-None-Match already names this report, else None."""
+    if key is not None and request.if_none_match.contains(key):
+        return Response(status=304, headers=result_headers(key))
+    return None
+
+def result_response(result, key=None):
+    """
+    JSON response for a report. Successful reports with a cache key carry
+    it as a strong ETag (plus Content-Location for cheap GET revalidation)
+    and turn into 304 when the client already holds that ETag.
+    """
+    status = 200 if "error" not in result else 400
+    if key is None or status != 200:
+        return jsonify(result), status
+    return not_modified(key) or (jsonify(result), status, result_headers(key))
+
+def run_job(video_path, progress, job):
+    # Jobs share the Pose pool, so they take admission slots like requests
+    # (client None: no per-client cap); a busy server delays them instead.
+    while True:
+        try:
+            return cached_analysis(job["exercise_type"], video_path, job["sampling"], file_digest(video_path),
+                                   progress, client=None)[0]
+        except Overloaded as e:
+            time.sleep(e.retry_after)
+
+JOBS = JobQueue(run_job)
+
+# Set by start_serving() once this process can take traffic; DRAINING by
+# drain() when it is shutting down (see serve.py).
+READY = threading.Event()
+DRAINING = threading.Event()
 
+def start_serving():
+    """Per-process start-up: warm the Pose pool and start the job workers."""
+    POSE_POOL.warm()
+    JOBS.start()
+    READY.set()
+
+def drain():
+    """Fail readiness and stop starting background jobs; in-flight requests carry on."""
+    DRAINING.set()
+    JOBS.stop()
+
+def parse_deadline(value, started):
+    """deadline_ms counted from `started` (the request's arrival) -> perf_counter() deadline or None; raises UploadError."""
+    if value in (None, ""):
+        return None
+    try:
+        ms = int(value)
+    except ValueError:
+        raise UploadError("deadline_ms must be a whole number of milliseconds.")
+    if ms <= 0:
+        raise UploadError("deadline_ms must be positive.")
+    return started + (ms - DEADLINE_RESERVE_MS) / 1000.0
+
+def exercise_error(exercise_type):
+    """Why exercise_type cannot be analyzed, or None."""
+    names = parse_exercise_types(exercise_type)
+    unknown = [name for name in names if name not in EXERCISES]
+    if not names or unknown:
+        bad = unknown[0] if unknown else exercise_type
+        return UNSUPPORTED_EXERCISE.format(bad)
+    return None
+
+def upload_form(check_exercise=True):
+    """(file, ext, exercise_type, sampling) from a buffered multipart upload; raises UploadError."""
+    if "video" not in request.files:
+        raise UploadError("Missing 'video' file field")
     exercise_type = request.form.get("exercise_type", "squat").lower()
+    if check_exercise and exercise_error(exercise_type):
+        raise UploadError(exercise_error(exercise_type))
+    sampling = request.form.get("sampling", "uniform").lower()
+    if sampling not in SAMPLING_MODES:
+        raise UploadError(f"Unsupported sampling '{sampling}'. Use one of {SAMPLING_MODES}")
     file = request.files["video"]
     if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
-
+        raise UploadError("Empty filename")
     _, ext = os.path.splitext(file.filename.lower())
     if ext not in ALLOWED_EXT:
-        return jsonify({"error": f"Unsupported format '{ext}'. Use one of {ALLOWED_EXT}"}), 400
+        raise UploadError(f"Unsupported format '{ext}'. Use one of {ALLOWED_EXT}")
+    return file, ext, exercise_type, sampling
 
+def save_temp(file, ext, chunk_size=1 << 20):
+    """Spool an uploaded file to a temp path, hashing it on the way: (path, sha256 hex)."""
+    t0 = time.perf_counter()
+    h = hashlib.sha256()
     with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-        file.save(tmp.name)
-        tmp_path = tmp.name
+        for chunk in iter(lambda: file.stream.read(chunk_size), b""):
+            h.update(chunk)
+            tmp.write(chunk)
+    METRICS.observe("mais_upload_seconds", time.perf_counter() - t0)
+    return tmp.name, h.hexdigest()
 
+def remove_quietly(path):
     try:
-        # Simple dispatcher
-        if exercise_type == "squat":
-            result = analyze_squat_video(tmp_path)
-        elif exercise_type == "pushup":
-            result = analyze_pushup_video(tmp_path)
-        elif exercise_type == "lunge":                     # ⬅️ add this
-            result = analyze_lunge_video(tmp_path)
-        else:
-            result = {"error": f"Exercise '{exercise_type}' not supported. Try 'squat', 'pushup', or 'lunge'."}
+        os.remove(path)
+    except Exception:
+        pass
 
-        status = 200 if "error" not in result else 400
-        return jsonify(result), status
-    finally:
+def progress_event(done, total, detections=None, provisional=None):
+    event = {"event": "progress", "frames_processed": done, "frames_total": total,
+             "detections": detections,
+             "detection_rate": round(detections / done, 3) if detections is not None and done else None}
+    if provisional is not None:
+        event["provisional"] = provisional
+    return event
+
+def event_callbacks(exercise_type, sampling, events):
+    """(progress, on_partial) for run_analysis that put NDJSON progress events on `events`."""
+    names = parse_exercise_types(exercise_type)
+    next_event = [0.0]
+
+    def on_partial(done, total, detections, reports):
+        events.put(progress_event(done, total, detections,
+                                  reports[names[0]] if len(names) == 1 else {"reports": reports}))
+
+    def progress(done, total):
+        # adaptive sampling: counts only, no provisional reports
+        now = time.monotonic()
+        if now >= next_event[0]:
+            next_event[0] = now + PARTIAL_INTERVAL_S
+            events.put(progress_event(done, total))
+
+    return (progress if sampling != "uniform" else None), on_partial
+
+def stream_analysis(analyze, cancel):
+    """
+    NDJSON lines for /api/analyze/stream. analyze(events) runs on its own
+    thread, putting progress events on `events` (see event_callbacks), and
+    returns (result, key). A client that goes away (or cancels) trips
+    `cancel`, so the run stops at its next sample.
+    """
+    events = queue.Queue()
+
+    def work():
+        key = None
+        status = None
         try:
-            os.remove(tmp_path)
+            result, key = analyze(events)
+        except UploadError as e:
+            result, status = {"error": str(e)}, 400
+        except Overloaded as e:
+            result, status = {"error": str(e), "retry_after": e.retry_after}, e.status
+        except Cancelled as e:
+            app.logger.info("streamed analysis cancelled: %s", e)
+            result, status = {"error": "Analysis cancelled."}, 499
         except Exception:
-            pass
+            app.logger.exception("streamed analysis failed")
+            result = {"error": "Analysis failed."}
+        finally:
+            cancel.close()
+        status = status or (200 if "error" not in result else 400)
+        events.put({"event": "result", "status": status, "result": result,
+                    "etag": RESULT_CACHE.etag(key) if key and status == 200 else None})
+        events.put(None)
+
+    events.put(progress_event(0, None))
+    threading.Thread(target=work, name="analysis-stream", daemon=True).start()
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield json.dumps(event) + "\n"
+    finally:
+        # the server closes us early when a write to the client fails
+        cancel.cancel("client disconnected")
+
+def claimed_digest():
+    """
+    The upload's sha256 as the client states it (X-Content-SHA256), or None.
+    It only lets a streamed upload find matching work before its last byte
+    arrives; nothing is stored or shared under it unless the bytes match.
+    """
+    value = request.headers.get("X-Content-SHA256", "").strip().lower()
+    return value if len(value) == 64 and all(c in "0123456789abcdef" for c in value) else None
+
+def can_stream(fields, claimed=None):
+    """
+    stream_upload's can_stream: analyze while the body arrives. A streamed
+    analysis must start reading within FIFO_OPEN_TIMEOUT, so it can't wait
+    for an admission slot; spool instead while busy. Adaptive sampling and
+    deadline runs (coarse to fine) seek, which needs the whole file. An
+    upload `claimed` to match a stored or running analysis spools too:
+    once hashed, it shares that report through cached_analysis. So does
+    one without a claim while the result or landmark cache is on, since
+    its hash (and so a repeat upload) is only known after the last byte.
+    """
+    sampling = fields.get("sampling", "uniform").lower()
+    if not ("exercise_type" in fields and sampling != "adaptive" and not fields.get("deadline_ms")
+            and ADMISSION.available()):
+        return False
+    if claimed is None:
+        return not (RESULT_CACHE.enabled or LANDMARK_CACHE.enabled)
+    return not RESULT_CACHE.pending(analysis_key(fields["exercise_type"].lower(), sampling, claimed))
+
+def late_field(used, fields, names=("exercise_type", "sampling", "deadline_ms", "profile")):
+    """
+    The first of `names` a streamed analysis started without: its value in
+    the whole form (`fields`) differs from the one the analysis saw (`used`)
+    because it came after the video part. None if there is none.
+    """
+    return next((name for name in names if fields.get(name) != used.get(name)), None)
+
+def upload_analysis(exercise_type, sampling, path, digest, client, cancel, claimed=None, progress=None,
+                    on_partial=None):
+    """
+    (result, key) for a video stream_upload() hands over; digest is its
+    callable. A spooled upload goes through cached_analysis. A streamed
+    one only knows its hash after the last byte: it is computed, then
+    stored under that hash for later requests (key is None if the upload
+    never completed). With a `claimed` hash (claimed_digest) the run is
+    registered under it from the start, so identical uploads arriving
+    meanwhile wait for it instead of analyzing the same bytes again; it is
+    stored and shared only if the bytes turn out to match.
+    """
+    if digest() is not None:
+        result, key, _ = cached_analysis(exercise_type, path, sampling, digest(), progress, on_partial,
+                                         client=client, cancel=cancel)
+        return result, key
+
+    def compute():
+        result = admitted_analysis(client, exercise_type, path, sampling, digest,
+                                   progress=cancel.watch(progress), on_partial=on_partial)
+        # A FIFO-specific failure shouldn't stick to these bytes (and may not
+        # have read the FIFO at all, so don't wait for the upload).
+        if "error" in result or digest(wait=True) is None or claimed not in (None, digest()):
+            raise Uncacheable(result)
+        return result
+
+    if claimed is None:
+        try:
+            result = compute()
+        except Uncacheable as e:
+            return e.result, None
+        key = analysis_key(exercise_type, sampling, digest())
+        RESULT_CACHE.put(key, result)
+        return result, key
+    key = analysis_key(exercise_type, sampling, claimed)
+    result, source = shared_run(key, compute, cancel)
+    if source == "uncached":
+        return result, None
+    if source != "computed":
+        # joined another upload's run: only valid if these bytes are the same
+        app.logger.info("analyze %s result: %s (streamed)", exercise_type, source)
+        if digest(wait=True) != claimed:
+            return {"error": "The upload does not match its X-Content-SHA256."}, None
+    return result, key
+
+def analyze_streaming():
+    """
+    /api/analyze for multipart bodies read straight off the socket.
+
+    WebM/MKV and MP4/MOV with moov ahead of mdat are analyzed while the body is
+    still arriving, provided exercise_type (and sampling) precede the video
+    field and, with caching on, the request claims its hash in
+    X-Content-SHA256 (see can_stream). A streamed analysis starts with the
+    fields sent so far, so exercise_type, sampling, deadline_ms or profile
+    arriving after the video gets a 400 instead of being ignored.
+    """
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        return jsonify({"error": "Missing multipart boundary"}), 400
+
+    request_key = {}
+    client = client_id()
+    started = g.started
+    cancel = cancel_token()
+    claimed = claimed_digest()
+
+    def analyze_fields(fields, path, digest):
+        request_key["fields"] = fields
+        exercise_type = fields.get("exercise_type", "squat").lower()
+        sampling = fields.get("sampling", "uniform").lower()
+        if sampling not in SAMPLING_MODES:
+            return {"error": f"Unsupported sampling '{sampling}'. Use one of {SAMPLING_MODES}"}
+        if fields.get("profile") == "1":
+            check_profile(client)
+            return profiled_analysis(client, exercise_type, path, sampling)
+        try:
+            deadline = parse_deadline(fields.get("deadline_ms"), started)
+        except UploadError as e:
+            return {"error": str(e)}
+        if deadline is not None:
+            return cached_analysis(exercise_type, path, sampling, digest(), client=client, deadline=deadline,
+                                   cancel=cancel)[0]
+        if digest() is not None:
+            request_key["key"] = analysis_key(exercise_type, sampling, digest())
+            if not_modified(request_key["key"]):
+                return {}
+        result, request_key["key"] = upload_analysis(exercise_type, sampling, path, digest, client, cancel,
+                                                     claimed=claimed)
+        return result
+
+    try:
+        fields, result, streamed = stream_upload(
+            request.stream, boundary.encode("latin-1"), analyze_fields, ALLOWED_EXT,
+            fields=request.args.to_dict(), can_stream=lambda fields: can_stream(fields, claimed))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        cancel.close()
+    app.logger.info("analyze upload streamed=%s", streamed)
+    late = late_field(request_key["fields"], fields) if streamed else None
+    if late is not None:
+        return jsonify({"error": f"Form field '{late}' must come before the video to apply to a streamed upload."}), 400
+
+    key = request_key.get("key")
+    return not_modified(key) or result_response(result, key)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Uploads only: polls and stats reads would just add noise (and snapshot writes).
+    if request.method == "POST" and request.url_rule is not None:
+        METRICS.observe_request(request.url_rule.rule, response.status_code, time.perf_counter() - g.started)
+    return response
+
+def process_gauges():
+    pool, admission, jobs = POSE_POOL.stats(), ADMISSION.stats(), JOBS.stats()
+    return [
+        ("mais_pose_pool_size", "Pose instances this process may build.", pool["size"]),
+        ("mais_pose_pool_in_use", "Pose instances checked out.", pool["in_use"]),
+        ("mais_admission_running", "Analyses holding an admission slot.", admission["running"]),
+        ("mais_admission_queue_depth", "Analyses waiting for an admission slot.", admission["queue_depth"]),
+        ("mais_admission_rejected", "Analyses turned away since start (queue full, per-client cap, timeout).",
+         admission["rejected_queue_full"] + admission["rejected_client"] + admission["timed_out"]),
+        ("mais_jobs_queued", "Background jobs waiting for a worker.", jobs["queued"]),
+        ("mais_jobs_running", "Background jobs being analyzed.", jobs["running"]),
+        ("mais_result_cache_entries", "Reports held in the result cache.", RESULT_CACHE.stats()["entries"]),
+    ]
+
+METRICS.add_collector(process_gauges)
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape: per-stage latency histograms, frame counters and process gauges (metrics.py)."""
+    return Response(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/api/health", methods=["GET"])
+def health():
+    """Liveness: the process is up and answering requests."""
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+@app.route("/api/ready", methods=["GET"])
+def ready():
+    """Readiness: 200 once the Pose pool is warm, 503 before that and while draining."""
+    status = "draining" if DRAINING.is_set() else "ready" if READY.is_set() else "starting"
+    admission = ADMISSION.stats()
+    return jsonify({"status": status, "pid": os.getpid(), "running": admission["running"],
+                    "queue_depth": admission["queue_depth"]}), 200 if status == "ready" else 503
+
+@app.route("/api/pose-pool", methods=["GET"])
+def pose_pool_stats():
+    return jsonify(POSE_POOL.stats())
+
+@app.route("/api/landmark-cache", methods=["GET"])
+def landmark_cache_stats():
+    return jsonify(LANDMARK_CACHE.stats())
+
+@app.route("/api/result-cache", methods=["GET"])
+def result_cache_stats():
+    return jsonify(RESULT_CACHE.stats())
+
+@app.route("/api/results/<key>", methods=["GET"])
+def get_result(key):
+    """A cached report by its ETag value; 304 if If-None-Match still matches."""
+    result = RESULT_CACHE.get(key)
+    if result is None:
+        return jsonify({"error": "Unknown or expired result"}), 404
+    return result_response(result, key)
+
+@app.errorhandler(ProfileDenied)
+def profile_denied(e):
+    return jsonify({"error": str(e)}), 403
+
+@app.errorhandler(Cancelled)
+def cancelled(e):
+    # 499 as in nginx's "client closed request": usually nobody reads this
+    app.logger.info("analysis cancelled: %s", e)
+    return jsonify({"error": "Analysis cancelled."}), 499
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    app.logger.warning("request rejected (%s): %s", e.status, e)
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), e.status, {"Retry-After": str(e.retry_after)}
+
+@app.route("/api/admission", methods=["GET"])
+def admission_stats():
+    return jsonify(ADMISSION.stats())
+
+@app.route("/api/analyze", methods=["POST"])
+def analyze():
+    """
+    Analyze an uploaded video. At most ANALYZE_CONCURRENCY analyses run at
+    once with ANALYZE_QUEUE more waiting; beyond that (or past the
+    per-client cap) requests get 503/429 with Retry-After before their
+    upload is read. profile=1 (form field or query) attaches a profile of
+    the run for allowed clients (profiling.py) and answers 403 for others.
+    Form fields go ahead of the video (see analyze_streaming).
+    deadline_ms=N (form field or query) answers within about N ms of the
+    request's arrival with the best report so far and a "confidence"
+    section saying how much of the clip it covers (run_shared_pose_pass).
+    The analysis stops early if the client disconnects or cancels it (see
+    cancel_analysis). An X-Content-SHA256 header (the video's sha256 hex)
+    lets a streamed upload reuse a stored report or join an identical
+    analysis in progress (see upload_analysis); with caching on, uploads
+    without one are spooled so repeats still hit the caches (can_stream).
+    """
+    ADMISSION.check(client_id())
+    if STREAM_UPLOADS and request.mimetype == "multipart/form-data":
+        return analyze_streaming()
+
+    try:
+        file, ext, exercise_type, sampling = upload_form(check_exercise=False)
+        deadline = parse_deadline(request.values.get("deadline_ms"), g.started)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    profile = request.values.get("profile") == "1"
+    if profile:
+        check_profile(client_id())
+    tmp_path, digest = save_temp(file, ext)
+    cancel = cancel_token()
+
+    try:
+        if profile:
+            return result_response(profiled_analysis(client_id(), exercise_type, tmp_path, sampling))
+        if deadline is not None:
+            return result_response(cached_analysis(exercise_type, tmp_path, sampling, digest, client=client_id(),
+                                                   deadline=deadline, cancel=cancel)[0])
+        # Same bytes and parameters as a report the client already has?
+        response = not_modified(analysis_key(exercise_type, sampling, digest))
+        if response is not None:
+            return response
+        result, key, _ = cached_analysis(exercise_type, tmp_path, sampling, digest, client=client_id(),
+                                         cancel=cancel)
+        return result_response(result, key)
+    finally:
+        remove_quietly(tmp_path)
+        cancel.close()
+
+def landmark_upload():
+    """(landmarks, detected, (w, h)) from a /api/analyze/landmarks body; raises UploadError."""
+    if request.content_length is None or request.content_length > MAX_TRACK_SAMPLES * _ROW_BYTES + (1 << 20):
+        raise UploadError(f"Send at most {MAX_TRACK_SAMPLES} samples with a Content-Length.")
+    body = request.get_data(cache=False)
+    if body.startswith(TRACK_MAGIC):
+        try:
+            track = parse_track(body)
+        except ValueError as e:
+            raise UploadError(str(e).capitalize())
+        try:
+            size = (track.width, track.height)
+        except (KeyError, TypeError, ValueError):
+            raise UploadError("Landmark track has no frame size.")
+        landmarks = np.asarray(track.landmarks)
+    else:
+        try:
+            size = (int(request.args["width"]), int(request.args["height"]))
+        except (KeyError, ValueError):
+            raise UploadError("Raw landmarks need integer 'width' and 'height' query parameters.")
+        if len(body) % _ROW_BYTES:
+            raise UploadError(f"Body must be float32 samples of {N_LANDMARKS} x [x, y, z, visibility].")
+        # normalized [0, 1] coordinates, as MediaPipe reports them -> pixels
+        landmarks = np.frombuffer(body, dtype="<f4").reshape(-1, N_LANDMARKS, 4)
+        landmarks = landmarks * np.array([size[0], size[1], 1, 1], dtype=np.float32)
+    if min(size) <= 0 or len(landmarks) > MAX_TRACK_SAMPLES:
+        raise UploadError("Unsupported frame size or too many samples.")
+    detected = np.isfinite(landmarks).all(axis=(1, 2))
+    return landmarks, detected, size
+
+@app.route("/api/analyze/landmarks", methods=["POST"])
+def analyze_landmarks_route():
+    """
+    Score a pose track extracted on the client instead of a video. The body
+    is either raw little-endian float32 samples, each 33 x [x, y, z,
+    visibility] with x/y normalized to the frame (MediaPipe's output; NaN
+    rows = no pose) and ?width=&height= giving the frame size, or an
+    LMTRACK1 file (landmark_track.py). exercise_type is a query parameter
+    ("squat", "squat,lunge", "all"). No decode or inference happens here, so
+    these requests skip admission and the caches.
+    """
+    exercise_type = request.args.get("exercise_type", "squat").lower()
+    error = exercise_error(exercise_type)
+    try:
+        if error:
+            raise UploadError(error)
+        landmarks, detected, size = landmark_upload()
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    names = parse_exercise_types(exercise_type)
+    stats = {}
+    reports = analyze_landmarks(landmarks, detected, size, names, stats=stats)
+    app.logger.info("analyze %s landmarks: %d samples, %s", exercise_type, len(landmarks), stats)
+    if len(names) == 1:
+        return result_response(reports[names[0]])
+    result = {"reports": reports}
+    errors = [r["error"] for r in reports.values() if "error" in r]
+    if len(errors) == len(reports):
+        result["error"] = errors[0]
+    return result_response(result)
+
+@app.route("/api/analyze/stream", methods=["POST"])
+def analyze_stream():
+    """
+    /api/analyze with live progress, as newline-delimited JSON:
+
+      {"event": "progress", "frames_processed", "frames_total", "detections",
+       "detection_rate", "provisional"}        repeated while the pass runs
+      {"event": "result", "status", "result", "etag"}
+                                               last line; result and ETag as /api/analyze
+
+    frames_total is an estimate (null if unknown); provisional is the report
+    over the frames so far (uniform sampling only). Clients may disconnect
+    as soon as the detection rate looks hopeless; the run stops with them
+    (or on POST /api/analyze/cancel/<X-Request-Id>). Admission as /api/analyze;
+    a request that loses its place after the stream started ends with a
+    result event of status 429/503. Multipart bodies are read as the
+    response streams, so a streamable video is analyzed while it uploads
+    (see can_stream); bad fields then end the stream with a status 400
+    result event.
+    """
+    ADMISSION.check(client_id())
+    client = client_id()
+    cancel = cancel_token()
+    if STREAM_UPLOADS and request.mimetype == "multipart/form-data":
+        boundary = request.mimetype_params.get("boundary")
+        if not boundary:
+            return jsonify({"error": "Missing multipart boundary"}), 400
+        body = request.stream
+        query = request.args.to_dict()
+        claimed = claimed_digest()
+
+        def analyze(events):
+            # Read here, on the analysis thread, while the response streams.
+            def analyze_fields(fields, path, digest):
+                used.update(fields)
+                exercise_type = fields.get("exercise_type", "squat").lower()
+                sampling = fields.get("sampling", "uniform").lower()
+                error = exercise_error(exercise_type)
+                if error is None and sampling not in SAMPLING_MODES:
+                    error = f"Unsupported sampling '{sampling}'. Use one of {SAMPLING_MODES}"
+                if error is not None:
+                    return {"error": error}, None
+                progress, on_partial = event_callbacks(exercise_type, sampling, events)
+                return upload_analysis(exercise_type, sampling, path, digest, client, cancel, claimed=claimed,
+                                       progress=progress, on_partial=on_partial)
+
+            used = {}
+            fields, (result, key), streamed = stream_upload(
+                body, boundary.encode("latin-1"), analyze_fields, ALLOWED_EXT, fields=query,
+                can_stream=lambda fields: can_stream(fields, claimed))
+            app.logger.info("analyze/stream upload streamed=%s", streamed)
+            late = late_field(used, fields, ("exercise_type", "sampling")) if streamed else None
+            if late is not None:
+                raise UploadError(f"Form field '{late}' must come before the video to apply to a streamed upload.")
+            return result, key
+    else:
+        try:
+            file, ext, exercise_type, sampling = upload_form()
+        except UploadError as e:
+            return jsonify({"error": str(e)}), 400
+        path, digest = save_temp(file, ext)
+
+        def analyze(events):
+            progress, on_partial = event_callbacks(exercise_type, sampling, events)
+            try:
+                result, key, _ = cached_analysis(exercise_type, path, sampling, digest, progress, on_partial,
+                                                 client=client, cancel=cancel)
+            finally:
+                remove_quietly(path)
+            return result, key
+
+    return Response(stream_analysis(analyze, cancel), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/analyze/cancel/<request_id>", methods=["POST"])
+def cancel_analysis(request_id):
+    """
+    Stop the caller's analysis that was sent with X-Request-Id: <request_id>
+    (on any server process, running or still uploading). For clients behind
+    proxies that don't pass disconnects on; closing the connection works too.
+    """
+    if not valid_request_id(request_id):
+        return jsonify({"error": "Bad request id"}), 400
+    request_cancel(client_id(), request_id)
+    return "", 202
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    """Queue an analysis; poll GET /api/jobs/<id> for progress and the result."""
+    JOBS.check()
+    try:
+        file, ext, exercise_type, sampling = upload_form()
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    job = JOBS.submit(file.save, ext, exercise_type=exercise_type, sampling=sampling)
+    return jsonify(job), 202, {"Location": f"/api/jobs/{job['id']}"}
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route("/api/jobs", methods=["GET"])
+def job_stats():
+    return jsonify(JOBS.stats())
+
+@app.route("/api/live/stats", methods=["GET"])
+def live_session_stats():
+    return jsonify({"available": Sock is not None, "sessions": live_stats()})
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/api/live")
+    def live(ws):
+        """
+        Live camera analysis; protocol in live.py. A connection holds an
+        ADMISSION slot and a pooled Pose instance for its whole lifetime,
+        so while sessions take every slot, uploads queue and are turned
+        away with Retry-After instead of waiting on the pool.
+        """
+        def receive():
+            try:
+                return ws.receive()
+            except ConnectionClosed:
+                return None
+
+        def error(message, retry_after=None):
+            ws.send(json.dumps({"type": "error", "error": message, "retry_after": retry_after}))
+
+        try:
+            exercise, fmt, size = parse_live_config(receive())
+        except ValueError as e:
+            return error(str(e))
+        try:
+            with ADMISSION.slot(client_id(), max_wait_s=LIVE_POSE_WAIT_S, timed=False), \
+                    POSE_POOL.checkout(timeout=LIVE_POSE_WAIT_S) as pose:
+                stats = serve_live(LiveSession(exercise, pose, fmt, size), receive, ws.send)
+        except Overloaded as e:
+            app.logger.warning("live session rejected (%s): %s", e.status, e)
+            return error(str(e), e.retry_after)
+        except queue.Empty:
+            return error("Server busy, try again shortly.", 1)
+        app.logger.info("live %s closed: %s", exercise, stats)
 
 if __name__ == "__main__":
+    # Development server; production runs serve.py.
+    # The debug reloader re-runs this file in a child process; only that one serves.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_serving()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,76 @@
+# bench_adaptive.py
+"""
+Depth accuracy and inference cost of uniform vs. adaptive sampling.
+
+    python bench_adaptive.py clip1.mp4 clip2.mov --exercises squat lunge
+
+Needs real exercise clips (and MediaPipe). For each clip and exercise it
+runs a dense reference pass (every frame), a uniform pass and an adaptive
+pass, each through run_pose_pass, and prints:
+
+  p10      the depth quantile the score uses (knee / elbow angle), with its
+           error vs. the dense pass
+  deepest  the smallest depth angle seen: over all samples for the dense
+           and uniform passes, over the refined rep_bottoms for adaptive
+  calls    pose inference calls
+  check    ok when adaptive's p10 error is no worse than uniform's (within
+           --tolerance degrees); the exit status is 1 if any row is not
+"""
+import argparse
+import os
+import sys
+
+from analysis import run_pose_pass
+from squat import new_squat_acc, squat_depth_angle
+from pushup import new_pushup_acc, pushup_depth_angle
+from lunge import new_lunge_acc, lunge_depth_angle
+
+# exercise -> (accumulator factory, depth metric, depth signal)
+DEPTH = {
+    "squat": (new_squat_acc, "knee_angles", squat_depth_angle),
+    "pushup": (new_pushup_acc, "elbow_angles", pushup_depth_angle),
+    "lunge": (new_lunge_acc, "front_knee_min_angles", lunge_depth_angle),
+}
+
+def depth_pass(path, exercise, sampling="uniform", **kwargs):
+    """(depth quantile, deepest angle, inference calls) of one pass; kwargs go to run_pose_pass."""
+    new_acc, metric, signal = DEPTH[exercise]
+    acc = new_acc()
+    series, bottoms, stats = [], [], {}
+
+    def on_frame(lm, weight=1):
+        acc.add(lm, weight)
+        value = signal(lm)
+        if value is not None:
+            series.append(value)
+
+    run_pose_pass(path, on_frame, sampling=sampling, signal=signal, on_extreme=bottoms.append, stats=stats,
+                  **kwargs)
+    acc.flush()
+    deepest = bottoms if sampling == "adaptive" else series
+    return acc[metric].value(), min(deepest, default=float("nan")), stats.get("inferred", 0)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("videos", nargs="+")
+    ap.add_argument("--exercises", nargs="+", default=list(DEPTH), choices=list(DEPTH))
+    ap.add_argument("--tolerance", type=float, default=0.05)
+    args = ap.parse_args()
+
+    print(f"{'video':<22}{'exercise':<9}{'p10 dense':>10}{'uniform':>9}{'err':>6}{'adaptive':>10}{'err':>6}"
+          f"{'deepest dense':>15}{'uniform':>9}{'adaptive':>10}{'calls unif':>12}{'adaptive':>10}{'check':>7}")
+    worse = 0
+    for path in args.videos:
+        for exercise in args.exercises:
+            ref, ref_min, _ = depth_pass(path, exercise, stride=1, max_samples=None)
+            uni, uni_min, uni_calls = depth_pass(path, exercise)
+            ada, ada_min, ada_calls = depth_pass(path, exercise, sampling="adaptive")
+            ok = abs(ada - ref) <= abs(uni - ref) + args.tolerance
+            worse += not ok
+            print(f"{os.path.basename(path)[:21]:<22}{exercise:<9}{ref:>10.1f}{uni:>9.1f}{abs(uni - ref):>6.1f}"
+                  f"{ada:>10.1f}{abs(ada - ref):>6.1f}{ref_min:>15.1f}{uni_min:>9.1f}{ada_min:>10.1f}"
+                  f"{uni_calls:>12}{ada_calls:>10}{'ok' if ok else 'WORSE':>7}")
+    sys.exit(1 if worse else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# bench_decode.py
+"""
+Decode cost of the old read-every-frame loop vs. frames.sample_frames.
+
+    python bench_decode.py clip1.mp4 clip2.mov --strides 1 3 6 30
+    python bench_decode.py --synthetic 1920x1080@60
+
+With no clips, a synthetic 10s 1080p60 clip is written to a temp file.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from frames import sample_frames
+
+def make_synthetic(spec="1920x1080@60", seconds=10):
+    size, fps = spec.split("@")
+    w, h = (int(v) for v in size.split("x"))
+    fps = int(fps)
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.mp4")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        frame = np.roll(noise, i * 7, axis=1)
+        cv2.circle(frame, (w // 2, (i * 13) % h), h // 8, (255, 255, 255), -1)
+        out.write(frame)
+    out.release()
+    return path
+
+def time_read_all(path, stride):
+    cap = cv2.VideoCapture(path)
+    t0 = time.perf_counter()
+    n = 0; frame_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret: break
+        frame_idx += 1
+        if frame_idx % stride != 0: continue
+        n += 1
+    dt = time.perf_counter() - t0
+    cap.release()
+    return dt, n
+
+def time_sampled(path, stride):
+    cap = cv2.VideoCapture(path)
+    t0 = time.perf_counter()
+    n = sum(1 for _ in sample_frames(cap, stride))
+    dt = time.perf_counter() - t0
+    cap.release()
+    return dt, n
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("videos", nargs="*")
+    ap.add_argument("--strides", type=int, nargs="+", default=[1, 3, 6, 30])
+    ap.add_argument("--synthetic", default="1920x1080@60")
+    args = ap.parse_args()
+
+    videos = args.videos or [make_synthetic(args.synthetic)]
+    print(f"{'video':<28}{'stride':>7}{'frames':>8}{'read() ms':>12}{'sampled ms':>12}{'saved ms':>10}{'speedup':>9}")
+    for path in videos:
+        for stride in args.strides:
+            base, n_base = time_read_all(path, stride)
+            samp, n_samp = time_sampled(path, stride)
+            note = "" if n_base == n_samp else f"  (sample count differs: {n_base} vs {n_samp})"
+            print(f"{os.path.basename(path)[:27]:<28}{stride:>7}{n_samp:>8}{base*1e3:>12.1f}{samp*1e3:>12.1f}"
+                  f"{(base-samp)*1e3:>10.1f}{base/max(samp,1e-9):>8.2f}x{note}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench_geometry.py
+"""
+Scalar vs batch geometry kernels on synthetic landmarks.
+
+    python bench_geometry.py --frames 600 --repeat 20
+
+Times angle_3pts / angle_to_vertical / dist_point_to_line called once per
+frame (the old per-frame analyzer loop) against their *_batch versions over
+the whole clip, checks both agree, and times each analyzer's batch metrics
+step. No video or model needed.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils import (
+    angle_3pts, angle_to_vertical, dist_point_to_line,
+    angle_3pts_batch, angle_to_vertical_batch, dist_point_to_line_batch,
+)
+from squat import squat_metrics
+from pushup import pushup_metrics
+from lunge import lunge_metrics
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--frames", type=int, default=600)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    a, b, c = (rng.random((args.frames, 2)) * 1000 for _ in range(3))
+    ta, tb, tc = ([tuple(p) for p in pts] for pts in (a, b, c))
+
+    kernels = [
+        ("angle_3pts", lambda: [angle_3pts(*t) for t in zip(ta, tb, tc)], lambda: angle_3pts_batch(a, b, c)),
+        ("angle_to_vertical", lambda: [angle_to_vertical(*t) for t in zip(ta, tb)], lambda: angle_to_vertical_batch(a, b)),
+        ("dist_point_to_line", lambda: [dist_point_to_line(*t) for t in zip(ta, tb, tc)],
+         lambda: dist_point_to_line_batch(a, b, c)),
+    ]
+    print(f"{args.frames} frames, best of {args.repeat}")
+    print(f"{'kernel':<22}{'scalar ms':>11}{'batch ms':>10}{'speedup':>9}{'max |Δ|':>11}")
+    for name, scalar, batch in kernels:
+        err = np.nanmax(np.abs(np.array(scalar(), dtype=float) - batch()))
+        ts, tb_ = best_of(scalar, args.repeat), best_of(batch, args.repeat)
+        print(f"{name:<22}{ts * 1e3:>11.2f}{tb_ * 1e3:>10.3f}{ts / tb_:>8.0f}x{err:>11.1e}")
+
+    lm = (rng.random((args.frames, 33, 4)) * [1280, 720, 1, 1]).astype(np.float32)
+    print(f"\n{'metrics':<22}{'batch ms':>10}")
+    for name, fn in (("squat", squat_metrics), ("pushup", pushup_metrics), ("lunge", lunge_metrics)):
+        t = best_of(lambda: fn(lm), args.repeat)
+        print(f"{name:<22}{t * 1e3:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# bench_resize.py
+"""
+Latency and score drift of resolution-adaptive preprocessing.
+
+    python bench_resize.py squat clip.mp4 --sizes 0 1280 960 640 480 320
+
+Each clip is analyzed at full resolution (size 0) and at every target long
+side; per-frame latency comes from the pipeline stats, drift is measured
+against the full-resolution report (overall score and per-metric scores).
+Needs real footage with a person in frame.
+"""
+import argparse
+import os
+
+from squat import analyze_squat_video
+from pushup import analyze_pushup_video
+from lunge import analyze_lunge_video
+
+ANALYZERS = {
+    "squat": analyze_squat_video,
+    "pushup": analyze_pushup_video,
+    "lunge": analyze_lunge_video,
+}
+
+def run(analyze, path, long_side):
+    stats = {}
+    result = analyze(path, stats=stats, long_side=long_side or None)
+    return result, stats
+
+def metric_scores(result):
+    return {k: v["score"] for k, v in result.get("detailed_breakdown", {}).items()}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("exercise", choices=sorted(ANALYZERS))
+    ap.add_argument("videos", nargs="+")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[0, 1280, 960, 640, 480, 320])
+    args = ap.parse_args()
+    analyze = ANALYZERS[args.exercise]
+
+    print(f"{'video':<24}{'long side':>10}{'ms/frame':>10}{'resize+cvt':>12}{'infer':>8}{'overall':>9}{'Δoverall':>10}{'Δmetric max':>13}")
+    for path in args.videos:
+        ref = None
+        for size in args.sizes:
+            result, st = run(analyze, path, size)
+            n = max(st.get("inferred", 0), 1)
+            per_frame = st.get("wall_s", 0.0) / n * 1e3
+            prep = (st.get("resize_s", 0.0) + st.get("convert_s", 0.0)) / n * 1e3
+            infer = st.get("infer_s", 0.0) / n * 1e3
+            if "error" in result:
+                print(f"{os.path.basename(path)[:23]:<24}{size or 'full':>10}{per_frame:>10.1f}{prep:>12.2f}{infer:>8.1f}  {result['error']}")
+                continue
+            if ref is None:
+                ref = result
+            d_overall = result["overall_score"] - ref["overall_score"]
+            ref_m, cur_m = metric_scores(ref), metric_scores(result)
+            d_metric = max((abs(cur_m[k] - ref_m[k]) for k in ref_m), default=0)
+            print(f"{os.path.basename(path)[:23]:<24}{size or 'full':>10}{per_frame:>10.1f}{prep:>12.2f}{infer:>8.1f}"
+                  f"{result['overall_score']:>9}{d_overall:>+10}{d_metric:>13}")
+
+if __name__ == "__main__":
+    main()
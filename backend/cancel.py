@@ -0,0 +1,115 @@
+# cancel.py
+"""
+Stopping analyses nobody is waiting for.
+
+A CancelToken trips when its client closes the connection (the request's
+socket reads EOF) or asks to cancel: POST /api/analyze/cancel/<request_id>
+drops a marker file under CANCEL_DIR, so the request may land on any
+server process. Analyses poll the token through their progress callback
+(watch()), which every pose pass calls after each sample; a tripped token
+raises Cancelled there, and unwinding the pass releases the capture and
+the Pose instance while the request's own cleanup removes its temp file.
+"""
+import hashlib
+import os
+import re
+import select
+import socket
+import tempfile
+import threading
+import time
+
+CANCEL_DIR = os.environ.get("CANCEL_DIR") or os.path.join(tempfile.gettempdir(), "mais-cancel")
+# Seconds between looks at the socket / marker while a pass runs.
+CANCEL_POLL_S = float(os.environ.get("CANCEL_POLL_S", 0.25))
+# Markers for requests that never showed up (or already finished) expire.
+MARKER_TTL_S = 600
+
+_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+class Cancelled(Exception):
+    pass
+
+def valid_request_id(request_id):
+    return bool(_ID.match(request_id or ""))
+
+def marker_path(client, request_id, root=CANCEL_DIR):
+    name = hashlib.sha256(f"{client}\0{request_id}".encode()).hexdigest()[:32]
+    return os.path.join(root, name)
+
+def request_cancel(client, request_id, root=CANCEL_DIR):
+    """Mark (client, request_id) cancelled for whichever process runs it; prunes stale markers."""
+    os.makedirs(root, exist_ok=True)
+    with open(marker_path(client, request_id, root), "w"):
+        pass
+    now = time.time()
+    for entry in os.scandir(root):
+        try:
+            if now - entry.stat().st_mtime > MARKER_TTL_S:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def peer_closed(sock):
+    """True once the peer has closed `sock` (readable, nothing to read); False when unsure."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK | getattr(socket, "MSG_DONTWAIT", 0)) == b""
+    except ConnectionError:
+        return True
+    except (OSError, ValueError):   # TLS sockets refuse recv flags, fds past select's limit, ...
+        return False
+
+class CancelToken:
+    """
+    sock is the request's client socket (None: no disconnect detection),
+    marker the path request_cancel() creates for this request (None: no
+    explicit cancel). Both are looked at most every poll_s.
+    """
+
+    def __init__(self, sock=None, marker=None, poll_s=CANCEL_POLL_S):
+        self.sock = sock
+        self.marker = marker
+        self.poll_s = poll_s
+        self.reason = None
+        self._event = threading.Event()
+        self._next_poll = 0.0
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and (self.sock is not None or self.marker is not None):
+            now = time.monotonic()
+            if now >= self._next_poll:
+                self._next_poll = now + self.poll_s
+                if self.marker is not None and os.path.exists(self.marker):
+                    self.cancel("cancelled by client")
+                elif self.sock is not None and peer_closed(self.sock):
+                    self.cancel("client disconnected")
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+    def watch(self, progress=None):
+        """A progress(done, total) callback that check()s, then calls `progress` (if any)."""
+        def watched(done, total):
+            self.check()
+            if progress is not None:
+                progress(done, total)
+        return watched
+
+    def close(self):
+        """Done with the request: drop its marker, if any."""
+        if self.marker is not None:
+            try:
+                os.remove(self.marker)
+            except OSError:
+                pass
@@ -0,0 +1,89 @@
+# exercises.py
+import time
+from collections import namedtuple
+
+from squat import new_squat_acc, squat_report
+from pushup import new_pushup_acc, pushup_report
+from lunge import new_lunge_acc, lunge_report
+from pipeline import DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES, replay_landmarks
+from analysis import run_shared_pose_pass, finish_report
+
+# limit_detections: whether max_frames counts detections or samples for the
+# exercise (see pipeline.run_pose_pipeline).
+Exercise = namedtuple("Exercise", "new_acc report limit_detections")
+
+# Wall-clock seconds between provisional reports in analyze_exercises.
+PARTIAL_INTERVAL_S = 0.5
+
+EXERCISES = {
+    "squat": Exercise(new_squat_acc, squat_report, True),
+    "pushup": Exercise(new_pushup_acc, pushup_report, True),
+    "lunge": Exercise(new_lunge_acc, lunge_report, False),
+}
+
+def parse_exercise_types(value):
+    """'all', one name or a comma-separated list -> list of names, in order, without repeats."""
+    value = (value or "").strip().lower()
+    if value == "all":
+        return list(EXERCISES)
+    names = []
+    for name in value.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def analyze_exercises(video_path, names, max_frames=None, stride=None, stats=None, long_side=DEFAULT_LONG_SIDE,
+                      digest=None, progress=None, on_partial=None, partial_interval=PARTIAL_INTERVAL_S,
+                      sample_hz=SAMPLE_HZ, max_samples=MAX_SAMPLES, deadline=None):
+    """
+    Reports for several exercises from one decode + inference pass: {name: report}.
+
+    Each report matches what that exercise's analyze_*_video would return
+    for the same clip and settings (uniform sampling). progress is as in
+    run_pose_pass. on_partial(done, total, detections, reports), if given,
+    gets provisional reports over the samples so far at most every
+    partial_interval seconds (the first right after the first sample); a
+    report may still be {"error": ...} while detections are few. With a
+    deadline the reports cover what was sampled by then (see
+    run_shared_pose_pass; provisional reports stay empty until the end).
+    """
+    accs = {name: EXERCISES[name].new_acc() for name in names}
+    frame_size = []
+    next_partial = [0.0]
+
+    def on_progress(done, total):
+        if progress is not None:
+            progress(done, total)
+        now = time.monotonic()
+        if on_partial is None or not frame_size or now < next_partial[0]:
+            return
+        next_partial[0] = now + partial_interval
+        detections = max(acc.count for acc in accs.values())
+        on_partial(done, total, detections,
+                   {name: EXERCISES[name].report(accs[name], frame_size[0]) for name in names})
+
+    size = run_shared_pose_pass(
+        video_path, [(accs[name].add, EXERCISES[name].limit_detections) for name in names],
+        stride=stride, max_frames=max_frames, long_side=long_side, digest=digest, stats=stats,
+        sample_hz=sample_hz, max_samples=max_samples, deadline=deadline,
+        progress=on_progress if progress is not None or on_partial is not None else None,
+        on_open=lambda w, h: frame_size.append((w, h)))
+    if size is None:
+        return {name: {"error": "Could not open video."} for name in names}
+    return {name: finish_report(EXERCISES[name].report, accs[name], size, stats) for name in names}
+
+def analyze_landmarks(landmarks, detected, size, names, max_frames=None, stats=None):
+    """
+    Reports for landmarks extracted elsewhere (the browser, a stored track):
+    {name: report}. landmarks is (n, 33, 4) pixel-space rows for a (w, h) =
+    size frame as from utils.pose_array, detected a bool (n,) mask. Rows are
+    taken as the samples (no stride); max_frames applies as in a pose pass.
+    """
+    reports = {}
+    for name in names:
+        exercise = EXERCISES[name]
+        acc = exercise.new_acc()
+        replay_landmarks(landmarks, detected, acc.add, max_frames, exercise.limit_detections)
+        reports[name] = finish_report(exercise.report, acc, size, stats)
+    return reports
@@ -0,0 +1,74 @@
+# frames.py
+import itertools
+
+import cv2
+
+# Past this stride, seeking to the next sampled frame is cheaper than grabbing
+# through every frame in between (most phone clips have a keyframe every ~1s).
+SEEK_STRIDE = 30
+
+def sample_frames(cap, stride=1, seek_stride=SEEK_STRIDE, counts=None):
+    """
+    Yield (frame_idx, bgr_frame) for every `stride`-th frame of an open capture.
+
+    Frame indices are zero-based stream positions; the first sample is frame
+    stride-1, matching the analyzers' old `frame_idx % stride == 0` loops.
+    Skipped frames only go through grab(), so they are never converted to BGR
+    or copied out of the decoder; only sampled frames pay for retrieve().
+    For strides >= seek_stride we jump with CAP_PROP_POS_FRAMES instead and
+    fall back to grabbing if the backend refuses the seek. counts, if given,
+    is as in frames_at.
+    """
+    stride = max(1, int(stride))
+    return frames_at(cap, itertools.count(stride - 1, stride), seek_stride=seek_stride, counts=counts)
+
+def frames_at(cap, indices, seek_stride=SEEK_STRIDE, counts=None):
+    """
+    Yield (frame_idx, bgr_frame) for each zero-based index in `indices`.
+
+    Indices should be ascending; going backwards requires a seek and stops the
+    generator if the backend cannot seek. Forward gaps shorter than
+    seek_stride are grabbed through, longer ones are seeked. counts, if
+    given, is a dict whose "decoded" entry is incremented per grab/read.
+    """
+    pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES) or 0)
+    can_seek = True
+
+    for target in indices:
+        if target < pos or (can_seek and target - pos + 1 >= seek_stride):
+            if cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                pos = target
+            elif target < pos:
+                return
+            else:
+                can_seek = False
+        while pos < target:
+            if not cap.grab():
+                return
+            pos += 1
+            if counts is not None:
+                counts["decoded"] += 1
+        ok, frame = cap.read()
+        if not ok:
+            return
+        if counts is not None:
+            counts["decoded"] += 1
+        yield pos, frame
+        pos += 1
+
+def fit_long_side(frame, long_side):
+    """
+    Downscale `frame` so its longer edge is at most `long_side` pixels.
+
+    Aspect ratio is preserved, so MediaPipe's normalized landmarks still map
+    onto the original frame via utils.pose_array(..., w, h) with the original size.
+    Frames already small enough (or long_side=None) are returned untouched.
+    """
+    if not long_side:
+        return frame
+    h, w = frame.shape[:2]
+    scale = long_side / max(h, w)
+    if scale >= 1.0:
+        return frame
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
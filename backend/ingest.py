@@ -0,0 +1,257 @@
+# ingest.py
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NEED_DATA
+
+from metrics import METRICS
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_LIMIT = 1 << 20         # give up on finding moov/mdat after 1 MiB and spool instead
+FIFO_OPEN_TIMEOUT = 10.0      # seconds to wait for VideoCapture to open the read end
+
+CAN_STREAM = hasattr(os, "mkfifo")
+
+class UploadError(Exception):
+    """Client-side problem with the upload (bad field, extension, truncated body)."""
+
+def container_streamable(head):
+    """
+    Decide from the first bytes of an upload whether it can be decoded as it arrives.
+
+    WebM/Matroska always can. ISO BMFF (mp4/mov) can when `moov` (or a
+    fragmented `moof`) comes before `mdat`; a trailing moov needs the whole
+    file. Returns True/False, or None if more bytes are needed.
+    """
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return True
+    off = 0
+    while off + 8 <= len(head):
+        size = int.from_bytes(head[off:off + 4], "big")
+        kind = head[off + 4:off + 8]
+        if not all(0x20 <= c <= 0x7e for c in kind):
+            return False                       # not a box stream (AVI, garbage, ...)
+        if kind in (b"moov", b"moof"):
+            return True
+        if kind == b"mdat":
+            return False
+        if size == 1:                          # 64-bit largesize follows the type
+            if off + 16 > len(head):
+                return None
+            size = int.from_bytes(head[off + 8:off + 16], "big")
+        elif size == 0:                        # box runs to EOF
+            return False
+        if size < 8:
+            return False
+        off += size
+    return None
+
+class _VideoSink:
+    """
+    Receives the bytes of the video part.
+
+    While sniffing, bytes are buffered. A streamable container is then piped
+    through a FIFO into analyze(path) running on a worker thread, so decoding
+    and pose inference overlap with the rest of the upload. Anything else is
+    spooled to a temp file for the caller to analyze once the last byte is in.
+    Either way the bytes are hashed on the fly; digest() returns the sha256
+    hex once the part is complete and None before that. digest(wait=True)
+    blocks until the upload is over, returning None if it never completed.
+    """
+
+    def __init__(self, ext, analyze, allow_stream):
+        self.ext = ext
+        self.analyze = analyze
+        self.allow_stream = allow_stream and CAN_STREAM
+        self.mode = "sniff"
+        self.streamed = False
+        self.complete = False
+        self.head = bytearray()
+        self.dir = tempfile.mkdtemp(prefix="upload-")
+        self.path = os.path.join(self.dir, "video" + ext)
+        self.fd = None
+        self.file = None
+        self.thread = None
+        self.result = None
+        self.error = None
+        self._over = threading.Event()
+        self._hash = hashlib.sha256()
+
+    # ---------- writing ----------
+    def write(self, data):
+        self._hash.update(data)
+        if self.mode == "sniff":
+            self.head += data
+            verdict = container_streamable(bytes(self.head)) if self.allow_stream else False
+            if verdict is None and len(self.head) < SNIFF_LIMIT:
+                return
+            self._start_fifo() if verdict else self._start_file()
+            data, self.head = bytes(self.head), None
+        if self.mode == "fifo":
+            self._write_fifo(data)
+        elif self.mode == "file":
+            self.file.write(data)
+
+    def digest(self, wait=False):
+        if wait:
+            self._over.wait()
+        return self._hash.hexdigest() if self.complete else None
+
+    def _start_file(self):
+        self.mode = "file"
+        self.file = open(self.path, "wb")
+
+    def _start_fifo(self):
+        self.mode = "fifo"
+        self.streamed = True
+        os.mkfifo(self.path)
+        self.thread = threading.Thread(target=self._run, name="upload-analyze", daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + FIFO_OPEN_TIMEOUT
+        while self.fd is None:
+            try:
+                self.fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                # ENXIO: reader not open yet
+                if e.errno != errno.ENXIO or not self.thread.is_alive() or time.monotonic() > deadline:
+                    self.mode = "discard"
+                    return
+                time.sleep(0.005)
+        os.set_blocking(self.fd, True)
+
+    def _write_fifo(self, data):
+        view = memoryview(data)
+        try:
+            while view:
+                n = os.write(self.fd, view)
+                view = view[n:]
+        except BrokenPipeError:
+            # Analyzer stopped reading (max_frames reached or open failed);
+            # keep draining the request body but drop the bytes.
+            self._close_fd()
+            self.mode = "discard"
+
+    def _close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _join(self):
+        # Once our write end is closed, a reader that (re)opens the FIFO would
+        # block forever waiting for a writer; OpenCV does exactly that when it
+        # retries other backends after FFmpeg rejects the stream. Keep handing
+        # such readers an immediate EOF until the analysis thread is done.
+        while self.thread is not None and self.thread.is_alive():
+            try:
+                os.close(os.open(self.path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            self.thread.join(timeout=0.02)
+
+    def _run(self):
+        try:
+            self.result = self.analyze(self.path)
+        except Exception as e:
+            self.error = e
+
+    # ---------- completion ----------
+    def finish(self):
+        """Called after the last byte: closes the spool file or waits for the streamed analysis."""
+        self.complete = True
+        self._over.set()
+        if self.mode == "sniff":
+            self._start_file()
+            self.file.write(bytes(self.head))
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._close_fd()
+        self._join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        self._over.set()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._close_fd()
+        self._join()
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def stream_upload(stream, boundary, analyze, allowed_ext, fields=None, file_field="video",
+                  can_stream=lambda fields: True, chunk_size=CHUNK_SIZE):
+    """
+    Parse a multipart/form-data body from `stream` as it arrives and analyze its video part.
+
+    Form fields seen before the video are passed to can_stream(fields); when
+    it agrees and the container allows it, analyze(fields, path, digest) starts on the
+    first frames while the rest of the body arrives. Otherwise the video is
+    spooled and analyze runs after the whole form (all fields) is read. Put
+    exercise_type ahead of the file in the form to get the overlap. `digest`
+    is a callable returning the upload's sha256 (None until the last byte;
+    digest(wait=True) waits for the upload to end, see _VideoSink).
+    The time from the first read to the video's last byte goes to
+    mais_upload_seconds, before a streamed analysis is waited for.
+    Returns (fields, result, streamed).
+    Raises UploadError for missing/empty/unsupported files or a truncated body.
+    """
+    fields = dict(fields or {})
+    decoder = MultipartDecoder(boundary)
+    field_name, field_buf, sink, eof = None, [], None, False
+    t0 = time.perf_counter()
+
+    try:
+        while True:
+            event = decoder.next_event()
+            if event is NEED_DATA:
+                if eof:
+                    raise UploadError("Incomplete upload")
+                chunk = stream.read(chunk_size)
+                eof = not chunk
+                decoder.receive_data(chunk or None)
+                continue
+            if isinstance(event, Epilogue):
+                break
+            if isinstance(event, File) and event.name == file_field and sink is None:
+                if not event.filename:
+                    raise UploadError("Empty filename")
+                _, ext = os.path.splitext(event.filename.lower())
+                if ext not in allowed_ext:
+                    raise UploadError(f"Unsupported format '{ext}'. Use one of {allowed_ext}")
+                snapshot = dict(fields)
+                sink = _VideoSink(ext, lambda path: analyze(snapshot, path, sink.digest), can_stream(snapshot))
+                field_name = None
+            elif isinstance(event, (Field, File)):
+                field_name = event.name if isinstance(event, Field) else None
+                field_buf = []
+            elif isinstance(event, Data):
+                if field_name is not None:
+                    field_buf.append(event.data)
+                    if not event.more_data:
+                        fields[field_name] = b"".join(field_buf).decode("utf-8", "replace")
+                        field_name = None
+                elif sink is not None and not sink.complete:
+                    sink.write(event.data)
+                    if not event.more_data:
+                        METRICS.observe("mais_upload_seconds", time.perf_counter() - t0)
+                        sink.finish()
+        if sink is None:
+            raise UploadError(f"Missing '{file_field}' file field")
+        if not sink.complete:
+            raise UploadError("Incomplete upload")
+        result = sink.result if sink.streamed else analyze(fields, sink.path, sink.digest)
+        return fields, result, sink.streamed
+    except ValueError as e:                    # malformed or truncated multipart body
+        raise UploadError(f"Malformed upload: {e}") from e
+    finally:
+        if sink is not None:
+            sink.abort()
+            sink.cleanup()
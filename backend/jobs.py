@@ -0,0 +1,282 @@
+# jobs.py
+"""
+Background analysis jobs.
+
+submit() saves an upload into its own directory under JOBS_DIR and returns
+at once; `workers` threads take job ids off a FIFO queue and call
+run(video_path, progress, job). Each job directory holds the video and
+job.json (status, progress, result), rewritten atomically on every change,
+so a restarted server re-queues whatever was queued or running when it
+stopped. Finished jobs drop their video; their job.json is deleted once it
+is older than retention_s.
+
+Several server processes may share JOBS_DIR: each unfinished job is held
+under an flock by the process that queued it, so start() only re-queues
+jobs whose owner has exited, and any process can answer get() from disk.
+
+Status goes queued -> running -> done | failed ("failed" when the result
+carries an "error", as /api/analyze answers 400 for those).
+"""
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:   # Windows: single process, nothing to coordinate
+    fcntl = None
+
+from pose_pool import POOL_SIZE
+from admission import Overloaded
+
+JOBS_DIR = os.environ.get("JOBS_DIR") or os.path.join(tempfile.gettempdir(), "mais-jobs")
+# Jobs analyzed at once; each also takes an admission slot while it runs.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 0)) or POOL_SIZE
+JOB_RETENTION_S = float(os.environ.get("JOB_RETENTION_S", 24 * 3600))
+# Queued (not yet running) jobs accepted before submit() turns callers away.
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", 100))
+
+# A job that was running through this many restarts is failed, not re-queued.
+MAX_ATTEMPTS = 3
+# Progress reaches job.json at most this often (memory is always current).
+PROGRESS_SAVE_S = 1.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_ID = re.compile(r"^[0-9a-f]{32}$")
+
+log = logging.getLogger(__name__)
+
+def public_job(job):
+    """The JSON a client sees: no file names, plus a 0-1 progress fraction."""
+    done, total = job["progress"]["done"], job["progress"]["total"]
+    if job["status"] in (DONE, FAILED):
+        fraction = 1.0
+    elif total:
+        fraction = round(min(done / total, 0.99), 3)
+    else:
+        fraction = 0.0 if job["status"] == QUEUED else None
+    out = {k: job[k] for k in ("id", "status", "exercise_type", "sampling",
+                               "created_at", "started_at", "finished_at")}
+    out["progress"] = {"done": done, "total": total, "fraction": fraction}
+    if job["result"] is not None:
+        out["result"] = job["result"]
+    return out
+
+class JobQueue:
+    def __init__(self, run, root=JOBS_DIR, workers=JOB_WORKERS, retention_s=JOB_RETENTION_S,
+                 max_queued=JOB_QUEUE_MAX):
+        self.run = run
+        self.root = root
+        self.workers = max(1, int(workers))
+        self.retention_s = retention_s
+        self.max_queued = max_queued
+        self._q = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._claims = {}
+        self._started = False
+        self._stopping = threading.Event()
+        self._next_prune = 0.0
+
+    # ---------- lifecycle ----------
+    def start(self):
+        """Re-queue jobs left over from the last run and start the workers (idempotent)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        os.makedirs(self.root, exist_ok=True)
+        pending = self._recover()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"analysis-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        for job in pending:
+            self._q.put(job["id"])
+        if pending:
+            log.info("re-queued %d analysis job(s) from %s", len(pending), self.root)
+
+    def stop(self):
+        """Start no further jobs (shutdown); queued ones stay on disk for the next start()."""
+        self._stopping.set()
+
+    def _recover(self):
+        pending = []
+        for entry in os.scandir(self.root):
+            job = self._read(entry.name) if _ID.match(entry.name) else None
+            if job is None:
+                continue
+            if job["status"] in (DONE, FAILED) or not self._claim(job["id"]):
+                continue
+            video = os.path.join(entry.path, job["video"])
+            if job["attempts"] >= MAX_ATTEMPTS or not os.path.exists(video):
+                self._finish(job, {"error": "Analysis was interrupted. Please upload the video again."})
+                continue
+            job.update(status=QUEUED, started_at=None, progress={"done": 0, "total": None})
+            with self._lock:
+                self._jobs[job["id"]] = job
+            self._save(job)
+            pending.append(job)
+        pending.sort(key=lambda job: job["created_at"])
+        return pending
+
+    # ---------- API ----------
+    def check(self):
+        """Raise Overloaded(503) while max_queued jobs are already waiting."""
+        queued = self.stats()[QUEUED]
+        if queued >= self.max_queued:
+            raise Overloaded("Too many queued jobs, try again later.", 503,
+                             retry_after=min(300, 10 * max(1, queued // self.workers)))
+
+    def submit(self, save, ext, **params):
+        """
+        New queued job. save(path) writes the upload to `path`; params
+        (exercise_type, sampling, ...) are stored with the job and passed
+        to run() through it. Returns the public view.
+        """
+        self.start()
+        self.check()
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, job_id)
+        os.makedirs(directory)
+        self._claim(job_id)
+        job = dict(params, id=job_id, status=QUEUED, video="video" + ext, attempts=0,
+                   created_at=time.time(), started_at=None, finished_at=None,
+                   progress={"done": 0, "total": None}, result=None)
+        try:
+            save(os.path.join(directory, job["video"]))
+            self._save(job)
+        except BaseException:
+            self._unclaim(job_id)
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        with self._lock:
+            self._jobs[job_id] = job
+            view = public_job(job)
+        self._q.put(job_id)
+        return view
+
+    def get(self, job_id):
+        """Public view of a job, or None if it does not exist (or has expired)."""
+        if not _ID.match(job_id or ""):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return public_job(job)
+        job = self._read(job_id)
+        return public_job(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0}
+            for job in self._jobs.values():
+                if job["status"] in counts:
+                    counts[job["status"]] += 1
+        return dict(counts, workers=self.workers)
+
+    # ---------- workers ----------
+    def _work(self):
+        while True:
+            job_id = self._q.get()
+            if self._stopping.is_set():
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    continue
+                job.update(status=RUNNING, started_at=time.time(), attempts=job["attempts"] + 1)
+            self._save(job)
+            last_save = [time.monotonic()]
+
+            def progress(done, total):
+                job["progress"] = {"done": done, "total": total}
+                now = time.monotonic()
+                if now - last_save[0] >= PROGRESS_SAVE_S:
+                    last_save[0] = now
+                    self._save(job)
+
+            video = os.path.join(self.root, job_id, job["video"])
+            try:
+                result = self.run(video, progress, job)
+            except Exception:
+                log.exception("analysis job %s failed", job_id)
+                result = {"error": "Analysis failed."}
+            self._finish(job, result)
+            self._prune()
+
+    def _finish(self, job, result):
+        with self._lock:
+            job.update(status=FAILED if "error" in result else DONE, result=result, finished_at=time.time())
+        self._save(job)
+        with self._lock:
+            self._jobs.pop(job["id"], None)
+        self._unclaim(job["id"])
+        try:
+            os.remove(os.path.join(self.root, job["id"], job["video"]))
+        except OSError:
+            pass
+
+    # ---------- ownership ----------
+    def _claim(self, job_id):
+        """Lock the job for this process; False if another live process holds it."""
+        if fcntl is None:
+            return True
+        fd = os.open(os.path.join(self.root, job_id, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        with self._lock:
+            self._claims[job_id] = fd
+        return True
+
+    def _unclaim(self, job_id):
+        with self._lock:
+            fd = self._claims.pop(job_id, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _prune(self):
+        now = time.time()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + min(self.retention_s, 3600)
+        for entry in os.scandir(self.root):
+            job = self._read(entry.name) if _ID.match(entry.name) else None
+            if job is not None and job["finished_at"] and now - job["finished_at"] > self.retention_s:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    # ---------- job.json ----------
+    def _read(self, job_id):
+        try:
+            with open(os.path.join(self.root, job_id, "job.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, job):
+        with self._lock:
+            blob = json.dumps(job)
+        directory = os.path.join(self.root, job["id"])
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(blob)
+            os.replace(tmp, os.path.join(directory, "job.json"))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
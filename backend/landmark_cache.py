@@ -0,0 +1,107 @@
+# landmark_cache.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from landmark_track import samples_to_track, write_track, read_track
+
+# Bump when anything that changes the landmarks for the same bytes changes
+# (model settings in utils.make_pose, preprocessing, sampling semantics,
+# the landmark array layout).
+CACHE_VERSION = 3
+
+CACHE_DIR = os.environ.get("LANDMARK_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "mais-landmarks")
+CACHE_MAX_BYTES = int(float(os.environ.get("LANDMARK_CACHE_MB", 512)) * 1024 * 1024)
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 hex digest of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class LandmarkCache:
+    """
+    On-disk cache of raw per-sample pose landmarks, keyed by video content.
+
+    An entry is a landmark track (see landmark_track.py) of every sample a
+    uniform pose pass processed, with the frame size and whether the pass
+    reached the end of the clip in its metadata; hits are memory-mapped.
+    Keys cover the video's sha256 and the sampling parameters but not the
+    exercise, so squat, push-up and lunge share one entry. Hits refresh the
+    file's mtime; put() evicts least recently used entries once the
+    directory grows past max_bytes. max_bytes=0 disables the cache.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, digest, **params):
+        blob = json.dumps({"v": CACHE_VERSION, "video": digest, **params}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".lmt")
+
+    def get(self, key):
+        """The cached LandmarkTrack, or None."""
+        path = self._path(key)
+        try:
+            entry = read_track(path)
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return entry
+
+    def put(self, key, samples, width, height, fps, complete, **meta):
+        """Store a recorded pass: samples is [(frame_idx, (33, 4) array or None), ...]; meta goes into the track."""
+        os.makedirs(self.root, exist_ok=True)
+        track = samples_to_track(samples, fps, width=width, height=height, complete=bool(complete), **meta)
+        write_track(self._path(key), track)
+        with self._lock:
+            self._stats["stores"] += 1
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.root) if e.name.endswith(".lmt")]
+            except OSError:
+                return
+            files = []
+            for e in entries:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, e.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+LANDMARK_CACHE = LandmarkCache()
@@ -0,0 +1,160 @@
+# landmark_track.py
+"""
+Landmark tracks: the per-sample output of a pose pass in one flat file.
+
+Layout (all little-endian):
+
+    b"LMTRACK1"                     8-byte magic
+    uint32 header_len
+    header                          UTF-8 JSON: n, array offsets, metadata
+    padding to a 64-byte boundary
+    landmarks   float32 (n, 33, 4)  [x, y, z, visibility], x/y in pixels of the
+                                    width x height frame; NaN rows = no detection
+    timestamps  float64 (n,)        milliseconds from clip start
+    frames      int64   (n,)        zero-based frame index
+    detected    uint8   (n,)
+
+Every column sits at a 64-byte aligned offset, so read_track() maps them with
+np.memmap and nothing is read until rows are touched. A 600-sample track is
+~330 KB; the same samples as JSON (lists of floats) take ~1.3 MB and have
+to be parsed in full before any row is usable.
+"""
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b"LMTRACK1"
+N_LANDMARKS = 33
+ALIGN = 64
+
+_COLUMNS = (
+    ("landmarks", "<f4", (N_LANDMARKS, 4)),
+    ("timestamps_ms", "<f8", ()),
+    ("frames", "<i8", ()),
+    ("detected", "u1", ()),
+)
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+class LandmarkTrack:
+    """Columns of a track (np.memmap when read from disk) plus its metadata dict."""
+
+    def __init__(self, landmarks, timestamps_ms, frames, detected, meta):
+        self.landmarks = landmarks
+        self.timestamps_ms = timestamps_ms
+        self.frames = frames
+        self.detected = detected
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def width(self):
+        return int(self.meta["width"])
+
+    @property
+    def height(self):
+        return int(self.meta["height"])
+
+    def pixels(self, rows=slice(None)):
+        """xy of the selected rows in pixels of the original frame, shape (k, 33, 2)."""
+        return np.asarray(self.landmarks[rows, :, :2], dtype=np.float32)
+
+def samples_to_track(samples, fps=0.0, **meta):
+    """Build a LandmarkTrack from a recorded pass [(frame_idx, (33, 4) array or None), ...]."""
+    n = len(samples)
+    frames = np.fromiter((i for i, _ in samples), dtype=np.int64, count=n)
+    detected = np.fromiter((a is not None for _, a in samples), dtype=np.uint8, count=n)
+    landmarks = np.full((n, N_LANDMARKS, 4), np.nan, dtype=np.float32)
+    for row, (_, arr) in enumerate(samples):
+        if arr is not None:
+            landmarks[row] = arr
+    timestamps = frames * (1000.0 / fps) if fps > 0 else np.zeros(n)
+    return LandmarkTrack(landmarks, timestamps.astype(np.float64), frames, detected, dict(meta, fps=fps))
+
+def write_track(path, track):
+    """Write `track` to `path` atomically (temp file + rename)."""
+    n = len(track)
+    arrays = {
+        "landmarks": np.ascontiguousarray(track.landmarks, dtype="<f4").reshape(n, N_LANDMARKS, 4),
+        "timestamps_ms": np.ascontiguousarray(track.timestamps_ms, dtype="<f8").reshape(n),
+        "frames": np.ascontiguousarray(track.frames, dtype="<i8").reshape(n),
+        "detected": np.ascontiguousarray(track.detected, dtype="u1").reshape(n),
+    }
+
+    # Offsets depend on the header length, which depends on the offsets;
+    # reserve room by sizing the header with placeholder offsets first.
+    def header_bytes(offsets):
+        return json.dumps({"n": n, "offsets": offsets, "meta": track.meta}, default=_json_default).encode()
+    probe = header_bytes({name: 10 ** 12 for name, _, _ in _COLUMNS})
+    pos = _align(len(MAGIC) + 4 + len(probe))
+    offsets = {}
+    for name, _, _ in _COLUMNS:
+        offsets[name] = pos
+        pos = _align(pos + arrays[name].nbytes)
+    header = header_bytes(offsets)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(header)) + header)
+            for name, _, _ in _COLUMNS:
+                f.write(b"\0" * (offsets[name] - f.tell()))
+                f.write(arrays[name].tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def read_track(path, mmap=True):
+    """Open a track; columns are read-only np.memmap views unless mmap=False."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a landmark track")
+        (header_len,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_len))
+    n = header["n"]
+    cols = {}
+    for name, dtype, tail in _COLUMNS:
+        shape = (n,) + tail
+        if n == 0:
+            cols[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            cols[name] = np.memmap(path, dtype=dtype, mode="r", offset=header["offsets"][name], shape=shape)
+        else:
+            cols[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                     offset=header["offsets"][name]).reshape(shape)
+    return LandmarkTrack(cols["landmarks"], cols["timestamps_ms"], cols["frames"],
+                         cols["detected"], header["meta"])
+
+def parse_track(buf):
+    """A track from an in-memory LMTRACK1 blob (e.g. an upload); raises ValueError if malformed."""
+    buf = memoryview(buf)
+    if bytes(buf[:len(MAGIC)]) != MAGIC or len(buf) < len(MAGIC) + 4:
+        raise ValueError("not a landmark track")
+    (header_len,) = struct.unpack("<I", buf[len(MAGIC):len(MAGIC) + 4])
+    try:
+        header = json.loads(bytes(buf[len(MAGIC) + 4:len(MAGIC) + 4 + header_len]))
+        n, offsets, meta = int(header["n"]), header["offsets"], header["meta"]
+        cols = {}
+        for name, dtype, tail in _COLUMNS:
+            shape = (n,) + tail
+            cols[name] = np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape)),
+                                       offset=int(offsets[name])).reshape(shape)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"malformed landmark track: {e}") from e
+    return LandmarkTrack(cols["landmarks"], cols["timestamps_ms"], cols["frames"], cols["detected"], meta)
+
+def _json_default(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    raise TypeError(f"{type(v).__name__} is not JSON serializable")
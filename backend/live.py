@@ -0,0 +1,308 @@
+# live.py
+"""
+Live-camera analysis over a WebSocket (see app.py's /api/live).
+
+The client sends one JSON config message, then frames as binary messages:
+encoded images (JPEG/PNG/WebP) or, with {"format": "rgb", "width", "height"}
+in the config, raw RGB24. The socket reader drops each frame into a
+LatestFrame slot, replacing any frame inference has not picked up yet
+(counted as dropped), so a slow CPU skips frames instead of falling
+behind. A worker thread runs the connection's own Pose instance on the
+newest frame and sends back, as JSON text messages:
+
+    {"type": "frame", "seq", "detected", "angle", "metrics", "cues", "latency_ms"}
+    {"type": "rep", "rep", "depth", "duration_s", "cue"}       when a rep completes
+    {"type": "stats", ...}                                     every STATS_INTERVAL_S
+
+metrics are the exercise's per-frame values (squat_metrics etc. on one
+frame); cues fire once a fault has held for CUE_FRAMES processed frames.
+latency_ms runs from the frame's arrival to its reply being sent.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+import numpy as np
+
+from frames import fit_long_side
+from online_stats import StreamingQuantile
+from utils import pose_array
+from squat import squat_metrics, squat_depth_angle
+from pushup import pushup_metrics, pushup_depth_angle
+from lunge import lunge_metrics, lunge_depth_angle
+
+# Smaller than uploads' POSE_LONG_SIDE: live frames are latency bound.
+LIVE_LONG_SIDE = int(os.environ.get("LIVE_LONG_SIDE", 480)) or None
+STATS_INTERVAL_S = 1.0
+CUE_FRAMES = 3
+MAX_FRAME_BYTES = 8 << 20
+
+log = logging.getLogger(__name__)
+
+_active = set()
+_active_lock = threading.Lock()
+
+# A rep starts when the depth angle drops below `down`, ends when it rises
+# back above `up`, and is "shallow" if it never got below `shallow`
+# (the 50-point depth bands in score_squat/score_pushup/score_lunge).
+# cues: (metric, is_fault(value), message); thresholds are the warning
+# bands of the same scoring functions.
+LiveExercise = namedtuple("LiveExercise", "metrics depth_angle down up shallow cues")
+
+LIVE_EXERCISES = {
+    "squat": LiveExercise(squat_metrics, squat_depth_angle, 120, 160, 100, [
+        ("torso_angles", lambda v: v < 165, "Keep your chest up."),
+        ("knee_valgus_dev", lambda v: v < 0.85, "Push your knees out over your toes."),
+    ]),
+    "pushup": LiveExercise(pushup_metrics, pushup_depth_angle, 110, 150, 110, [
+        ("body_dev", lambda v: v > 0.12, "Keep your hips in line with shoulders and ankles."),
+        ("neck_tilt", lambda v: v > 30, "Keep your neck neutral."),
+    ]),
+    "lunge": LiveExercise(lunge_metrics, lunge_depth_angle, 120, 155, 125, [
+        ("torso_angles", lambda v: v < 165, "Stay tall through your torso."),
+        ("knee_track_dev", lambda v: v > 0.35, "Track your front knee over your toes."),
+        ("shin_angles", lambda v: v < 160, "Keep your front shin more vertical."),
+    ]),
+}
+
+class LatestFrame:
+    """One-slot mailbox: put() replaces a frame nobody has taken yet (counted in .dropped)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def take(self):
+        """The newest frame, waiting for one; None once closed."""
+        with self._cond:
+            while self._item is None and not self._closed:
+                self._cond.wait()
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._item = None
+            self._cond.notify_all()
+
+class RepCounter:
+    """Counts reps from the depth angle with up/down hysteresis."""
+
+    def __init__(self, down, up, shallow):
+        self.down, self.up, self.shallow = down, up, shallow
+        self.reps = 0
+        self._bottom = None
+        self._started = None
+
+    def update(self, angle, now):
+        """Feed one angle; returns a rep event when this one completes a rep."""
+        if angle is None:
+            return None
+        if self._bottom is None:
+            if angle < self.down:
+                self._bottom, self._started = angle, now
+            return None
+        self._bottom = min(self._bottom, angle)
+        if angle <= self.up:
+            return None
+        self.reps += 1
+        event = {"type": "rep", "rep": self.reps, "depth": round(self._bottom, 1),
+                 "duration_s": round(now - self._started, 2),
+                 "cue": "Go a little deeper." if self._bottom > self.shallow else None}
+        self._bottom = self._started = None
+        return event
+
+class LiveSession:
+    """Per-connection state: exercise tables, rep counter, cue streaks and stats."""
+
+    def __init__(self, exercise, pose, fmt="jpeg", size=None, long_side=LIVE_LONG_SIDE):
+        self.exercise = LIVE_EXERCISES[exercise]
+        self.name = exercise
+        self.pose = pose
+        self.fmt = fmt
+        self.size = size
+        self.long_side = long_side
+        self.slot = LatestFrame()
+        self.reps = RepCounter(self.exercise.down, self.exercise.up, self.exercise.shallow)
+        self._streaks = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._received = 0
+        self._processed = 0
+        self._detected = 0
+        self._recent = deque(maxlen=30)
+        self._latency = {"total": (StreamingQuantile(50), StreamingQuantile(95)),
+                         "infer": (StreamingQuantile(50), StreamingQuantile(95))}
+
+    # ---------- reader side ----------
+    def receive(self, data):
+        """Queue one binary frame message (latest wins)."""
+        with self._lock:
+            self._received += 1
+            seq = self._received
+        self.slot.put((seq, data, time.perf_counter()))
+
+    # ---------- worker side ----------
+    def decode(self, data):
+        if self.fmt == "rgb":
+            w, h = self.size
+            if len(data) != w * h * 3:
+                return None
+            return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 3)
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def process(self, seq, data, received_at):
+        """Messages for one frame: the frame reply and maybe a rep event."""
+        t0 = time.perf_counter()
+        frame = self.decode(data)
+        if frame is None:
+            return [{"type": "error", "seq": seq, "error": "Could not decode frame."}]
+        h, w = frame.shape[:2]
+        small = fit_long_side(frame, self.long_side)
+        rgb = small if self.fmt == "rgb" else cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        t1 = time.perf_counter()
+        res = self.pose.process(rgb)
+        t2 = time.perf_counter()
+
+        out = {"type": "frame", "seq": seq, "detected": bool(res.pose_landmarks),
+               "angle": None, "metrics": {}, "cues": []}
+        messages = [out]
+        if res.pose_landmarks:
+            lm = pose_array(res.pose_landmarks, w, h)
+            angle = self.exercise.depth_angle(lm)
+            out["angle"] = None if angle is None else round(angle, 1)
+            for name, values in self.exercise.metrics(lm[None]).items():
+                out["metrics"][name] = round(float(values[0]), 3) if len(values) else None
+            out["cues"] = self._cues(out["metrics"])
+            rep = self.reps.update(angle, t2)
+            if rep is not None:
+                messages.append(rep)
+        done = time.perf_counter()
+        out["latency_ms"] = {"queue": round((t0 - received_at) * 1e3, 1),
+                             "decode": round((t1 - t0) * 1e3, 1),
+                             "infer": round((t2 - t1) * 1e3, 1),
+                             "total": round((done - received_at) * 1e3, 1)}
+        with self._lock:
+            self._processed += 1
+            self._detected += out["detected"]
+            self._recent.append(done)
+            for key, secs in (("total", done - received_at), ("infer", t2 - t1)):
+                for q in self._latency[key]:
+                    q.add(secs * 1e3)
+        return messages
+
+    def _cues(self, metrics):
+        cues = []
+        for name, is_fault, message in self.exercise.cues:
+            value = metrics.get(name)
+            streak = self._streaks.get(name, 0) + 1 if value is not None and is_fault(value) else 0
+            self._streaks[name] = streak
+            if streak >= CUE_FRAMES:
+                cues.append(message)
+        return cues
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            recent = list(self._recent)
+            st = {"type": "stats", "exercise": self.name, "reps": self.reps.reps,
+                  "frames_received": self._received, "frames_processed": self._processed,
+                  "frames_dropped": self.slot.dropped, "frames_detected": self._detected,
+                  "fps_in": round(self._received / elapsed, 1) if elapsed > 0 else 0.0,
+                  "fps_out": round((len(recent) - 1) / (recent[-1] - recent[0]), 1)
+                  if len(recent) > 1 and recent[-1] > recent[0] else 0.0}
+            for key, (p50, p95) in self._latency.items():
+                st[f"{key}_ms_p50"] = round(p50.value(), 1) if len(p50) else None
+                st[f"{key}_ms_p95"] = round(p95.value(), 1) if len(p95) else None
+        return st
+
+    def work(self, send):
+        """Worker loop: process the newest frame until the slot closes or send() fails."""
+        next_stats = time.perf_counter() + STATS_INTERVAL_S
+        try:
+            while True:
+                item = self.slot.take()
+                if item is None:
+                    return
+                for message in self.process(*item):
+                    send(json.dumps(message))
+                if time.perf_counter() >= next_stats:
+                    next_stats = time.perf_counter() + STATS_INTERVAL_S
+                    send(json.dumps(self.stats()))
+        except Exception:
+            log.exception("live %s session stopped", self.name)
+        finally:
+            self.slot.close()
+
+def parse_live_config(text):
+    """(exercise, fmt, size) from the first message; raises ValueError."""
+    try:
+        config = json.loads(text or "{}")
+    except ValueError:
+        raise ValueError("First message must be a JSON config.")
+    exercise = str(config.get("exercise_type", "squat")).lower()
+    if exercise not in LIVE_EXERCISES:
+        raise ValueError(f"Exercise '{exercise}' not supported. Try 'squat', 'pushup', or 'lunge'.")
+    fmt = str(config.get("format", "jpeg")).lower()
+    if fmt == "rgb":
+        try:
+            size = (int(config["width"]), int(config["height"]))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Raw RGB frames need integer 'width' and 'height'.")
+        if min(size) <= 0 or size[0] * size[1] * 3 > MAX_FRAME_BYTES:
+            raise ValueError("Unsupported frame size.")
+        return exercise, fmt, size
+    return exercise, "jpeg", None
+
+def serve_live(session, receive, send):
+    """
+    Run a session: receive() returns the next message (bytes, str) or None
+    when the socket closes; send(str) writes one. Text messages other than
+    {"type": "reset"} (zero the rep count) are ignored. Returns final stats.
+    """
+    worker = threading.Thread(target=session.work, args=(send,), name="live-pose", daemon=True)
+    worker.start()
+    with _active_lock:
+        _active.add(session)
+    try:
+        while worker.is_alive():
+            message = receive()
+            if message is None:
+                break
+            if isinstance(message, (bytes, bytearray)):
+                if len(message) <= MAX_FRAME_BYTES:
+                    session.receive(bytes(message))
+            elif _control(message) == "reset":
+                session.reps = RepCounter(session.exercise.down, session.exercise.up, session.exercise.shallow)
+    finally:
+        session.slot.close()
+        worker.join()
+        with _active_lock:
+            _active.discard(session)
+    return session.stats()
+
+def live_stats():
+    """stats() of every open live session."""
+    with _active_lock:
+        sessions = list(_active)
+    return [session.stats() for session in sessions]
+
+def _control(text):
+    try:
+        return json.loads(text).get("type")
+    except (ValueError, AttributeError):
+        return None
@@ -1,23 +1,103 @@
 # lunge.py
-import cv2
 import numpy as np
 
 from utils import (
-    L,
-    lm_xy,
+    LEFT,
+    RIGHT,
     angle_3pts,
-    angle_to_vertical,
-    dist_point_to_line,
-    make_pose,
+    landmarks_xy,
+    norms,
+    angle_3pts_batch,
+    angle_to_vertical_batch,
+    dist_point_to_line_batch,
 )
+from pipeline import DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES
+from analysis import run_pose_pass, MetricStream, finish_report, add_rep_bottoms
+from online_stats import StreamingQuantile, Welford
+
+def _side_points(xy, j):
+    """(shoulder, hip, knee, ankle, foot_index) points of one side's SideJoints j."""
+    return (xy[..., j.shoulder, :], xy[..., j.hip, :], xy[..., j.knee, :],
+            xy[..., j.ankle, :], xy[..., j.foot_index, :])
+
+def new_lunge_acc():
+    return MetricStream(lunge_metrics, {
+        "front_knee_min_angles": StreamingQuantile(10),
+        "shin_angles": StreamingQuantile(50),
+        "torso_angles": StreamingQuantile(50),
+        "knee_track_dev": StreamingQuantile(90),
+        "step_width_ratios": StreamingQuantile(50),
+        "stride_len_ratios": StreamingQuantile(50),
+        "knee_x_offsets": Welford(),
+    })
+
+def lunge_metrics(lm):
+    """
+    Per-frame lunge metrics for stacked pixel-space landmarks lm (N, 33, 4), as 1-D arrays:
+      front_knee_min_angles  smallest = deeper
+      shin_angles            front shin vs vertical
+      torso_angles           torso vs vertical
+      knee_track_dev         lateral knee drift vs foot line (normalized)
+      step_width_ratios      feet horizontal spacing / pelvis width
+      stride_len_ratios      feet vertical spacing / leg length
+      knee_x_offsets         x-jitter for stability
+    """
+    xy = landmarks_xy(lm)
+    L_sh, L_hip, L_knee, L_ank, L_foot = _side_points(xy, LEFT)
+    R_sh, R_hip, R_knee, R_ank, R_foot = _side_points(xy, RIGHT)
+
+    # Compute both knee angles to identify front leg (more flexed = front);
+    # frames where either is undefined are skipped entirely.
+    L_knee_angle = angle_3pts_batch(L_hip, L_knee, L_ank)
+    R_knee_angle = angle_3pts_batch(R_hip, R_knee, R_ank)
+    ok = ~(np.isnan(L_knee_angle) | np.isnan(R_knee_angle))
+    left = (L_knee_angle < R_knee_angle)[ok][:, None]
+
+    L_sh, L_hip, L_knee, L_ank, L_foot = (p[ok] for p in (L_sh, L_hip, L_knee, L_ank, L_foot))
+    R_sh, R_hip, R_knee, R_ank, R_foot = (p[ok] for p in (R_sh, R_hip, R_knee, R_ank, R_foot))
+    f_hip, f_knee = np.where(left, L_hip, R_hip), np.where(left, L_knee, R_knee)
+    f_ank, f_toe = np.where(left, L_ank, R_ank), np.where(left, L_foot, R_foot)
+    f_sho = np.where(left, L_sh, R_sh)
+    pelvis_width = norms(R_hip - L_hip) + 1e-6
+
+    # 1) Front knee angle (depth)
+    fk_angle = angle_3pts_batch(f_hip, f_knee, f_ank)
+    # 2) Front shin angle vs vertical (knee->ankle)
+    shin_ang = angle_to_vertical_batch(f_knee, f_ank)
+    # 3) Torso angle vs vertical (shoulder->hip)
+    torso_ang = angle_to_vertical_batch(f_sho, f_hip)
+    # 4) Knee tracking deviation
+    knee_dev = dist_point_to_line_batch(f_knee, f_ank, f_toe) / (norms(f_hip - f_knee) + 1e-6)
+    # 5) Step width ratio (feet horizontal distance / pelvis width)
+    step_width = np.abs(L_foot[:, 0] - R_foot[:, 0]) / pelvis_width
+    # 6) Stride length ratio (feet vertical distance / leg length)
+    stride_len = np.abs(L_foot[:, 1] - R_foot[:, 1]) / (norms(f_hip - f_ank) + 1e-6)
 
-def _side_indices(side: str):
-    """Return (shoulder, hip, knee, ankle, foot_index) PoseLandmark indices for a side."""
-    if side == "left":
-        return (L.LEFT_SHOULDER, L.LEFT_HIP, L.LEFT_KNEE, L.LEFT_ANKLE, L.LEFT_FOOT_INDEX)
-    return (L.RIGHT_SHOULDER, L.RIGHT_HIP, L.RIGHT_KNEE, L.RIGHT_ANKLE, L.RIGHT_FOOT_INDEX)
+    return {
+        "front_knee_min_angles": fk_angle[~np.isnan(fk_angle)],
+        "shin_angles": shin_ang[~np.isnan(shin_ang)],
+        "torso_angles": torso_ang[~np.isnan(torso_ang)],
+        "knee_track_dev": knee_dev[~np.isnan(knee_dev)],
+        "step_width_ratios": step_width,
+        "stride_len_ratios": stride_len,
+        # 7) Stability via knee x-jitter
+        "knee_x_offsets": f_knee[:, 0],
+    }
 
-def analyze_lunge_video(video_path: str, max_frames: int = 600, stride: int = 3):
+def lunge_depth_angle(lm):
+    """Front (more flexed) knee angle, the adaptive sampler's depth signal."""
+    xy = landmarks_xy(lm)
+    angles = []
+    for j in (LEFT, RIGHT):
+        _, hip, knee, ank, _ = _side_points(xy, j)
+        angles.append(angle_3pts(hip, knee, ank))
+    if None in angles:
+        return None
+    return min(angles)
+
+def analyze_lunge_video(video_path: str, max_frames: int = None, stride: int = None, stats=None,
+                        long_side=DEFAULT_LONG_SIDE, sampling: str = "uniform", digest=None, progress=None,
+                        sample_hz: float = SAMPLE_HZ, max_samples: int = MAX_SAMPLES):
     """
     Analyze a lunge video and return frontend-ready JSON:
       - overall_score (0–100)
@@ -26,128 +106,50 @@ def analyze_lunge_video(video_path: str, max_frames: int = 600, stride: int = 3)
       - detailed_breakdown {metric:{score,feedback}}
       - improvement_tips [str]
     Heuristics focus on front-leg depth, knee tracking, shin & torso angle, step width, and stability.
+    sampling="adaptive" samples coarsely and refines around front-knee extremes; both passes are
+    scored, weighted by sample spacing, and the extremes' values are reported as
+    front_knee_depth.rep_bottoms (see adaptive.py).
+    digest (the video's sha256) lets repeat analyses reuse cached landmarks (see analysis.py).
+    progress(done, total) is called as samples are processed (see run_pose_pass).
+    Samples are taken at sample_hz within a max_samples budget (see run_pose_pass).
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    acc = new_lunge_acc()
+    bottoms = []
+    size = run_pose_pass(
+        video_path, acc.add,
+        stride=stride, max_frames=max_frames, limit_detections=False, long_side=long_side,
+        sampling=sampling, signal=lunge_depth_angle, on_extreme=bottoms.append,
+        digest=digest, stats=stats, progress=progress, sample_hz=sample_hz, max_samples=max_samples,
+    )
+    if size is None:
         return {"error": "Could not open video."}
 
-    width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1920)
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1080)
-
-    pose = make_pose()
-
-    # Accumulators
-    front_knee_min_angles = []   # smallest = deeper
-    shin_angles = []             # front shin vs vertical
-    torso_angles = []            # torso vs vertical
-    knee_track_dev = []          # lateral knee drift vs foot line (normalized)
-    step_width_ratios = []       # feet horizontal spacing / pelvis width
-    stride_len_ratios = []       # feet vertical spacing / leg length
-    knee_x_offsets = []          # x-jitter for stability
-
-    frame_i = 0
-    processed = 0
-
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        frame_i += 1
-        if frame_i % stride != 0:
-            continue
-        if processed >= max_frames:
-            break
-        processed += 1
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        res = pose.process(rgb)
-        if not res.pose_landmarks:
-            continue
-
-        lms = res.pose_landmarks.landmark
-
-        # Landmarks for each side
-        L_sh, L_hip, L_knee, L_ank, L_foot = _side_indices("left")
-        R_sh, R_hip, R_knee, R_ank, R_foot = _side_indices("right")
+    return add_rep_bottoms(finish_report(lunge_report, acc, size, stats), "front_knee_depth", bottoms)
 
-        Lhip  = lm_xy(lms, L_hip.value,   width, height)
-        Lknee = lm_xy(lms, L_knee.value,  width, height)
-        Lank  = lm_xy(lms, L_ank.value,   width, height)
-        Ltoe  = lm_xy(lms, L_foot.value,  width, height)
-        Lsho  = lm_xy(lms, L_sh.value,    width, height)
-
-        Rhip  = lm_xy(lms, R_hip.value,   width, height)
-        Rknee = lm_xy(lms, R_knee.value,  width, height)
-        Rank  = lm_xy(lms, R_ank.value,   width, height)
-        Rtoe  = lm_xy(lms, R_foot.value,  width, height)
-        Rsho  = lm_xy(lms, R_sh.value,    width, height)
-
-        # Compute both knee angles to identify front leg (more flexed = front)
-        L_knee_angle = angle_3pts(Lhip, Lknee, Lank)
-        R_knee_angle = angle_3pts(Rhip, Rknee, Rank)
-        if L_knee_angle is None or R_knee_angle is None:
-            continue
-
-        front = "left" if L_knee_angle < R_knee_angle else "right"
-        if front == "left":
-            f_hip, f_knee, f_ank, f_toe, f_sho = Lhip, Lknee, Lank, Ltoe, Lsho
-            b_hip, b_knee, b_ank, b_toe, b_sho = Rhip, Rknee, Rank, Rtoe, Rsho
-            pelvis_width = np.linalg.norm(np.array(Rhip) - np.array(Lhip)) + 1e-6
-        else:
-            f_hip, f_knee, f_ank, f_toe, f_sho = Rhip, Rknee, Rank, Rtoe, Rsho
-            b_hip, b_knee, b_ank, b_toe, b_sho = Lhip, Lknee, Lank, Ltoe, Lsho
-            pelvis_width = np.linalg.norm(np.array(Lhip) - np.array(Rhip)) + 1e-6
-
-        # --- Metrics for this frame ---
-
-        # 1) Front knee angle (depth)
-        fk_angle = angle_3pts(f_hip, f_knee, f_ank)
-        if fk_angle is not None:
-            front_knee_min_angles.append(fk_angle)
-
-        # 2) Front shin angle vs vertical (knee->ankle)
-        shin_ang = angle_to_vertical(f_knee, f_ank)
-        if shin_ang is not None:
-            shin_angles.append(shin_ang)
-
-        # 3) Torso angle vs vertical (shoulder->hip)
-        torso_ang = angle_to_vertical(f_sho, f_hip)
-        if torso_ang is not None:
-            torso_angles.append(torso_ang)
-
-        # 4) Knee tracking deviation
-        dev = dist_point_to_line(f_knee, f_ank, f_toe)
-        if dev is not None:
-            thigh_len = np.linalg.norm(np.array(f_hip) - np.array(f_knee)) + 1e-6
-            knee_track_dev.append(dev / thigh_len)
-
-        # 5) Step width ratio (feet horizontal distance / pelvis width)
-        feet_width = abs(Ltoe[0] - Rtoe[0])
-        step_width_ratios.append(float(feet_width / pelvis_width))
-
-        # 6) Stride length ratio (feet vertical distance / leg length)
-        feet_len = abs(Ltoe[1] - Rtoe[1])
-        leg_len = np.linalg.norm(np.array(f_hip) - np.array(f_ank)) + 1e-6
-        stride_len_ratios.append(float(feet_len / leg_len))
-
-        # 7) Stability via knee x-jitter
-        knee_x_offsets.append(f_knee[0])
+def lunge_report(acc, size):
+    """Final report from an accumulator a pose pass over a (w, h) = size video has fed."""
+    width, _ = size
+    acc.flush()
+    return score_lunge(acc, width)
 
-    cap.release()
-    pose.close()
+def score_lunge(acc, width: int):
+    front_knee_min_angles, shin_angles = acc["front_knee_min_angles"], acc["shin_angles"]
+    torso_angles, knee_track_dev = acc["torso_angles"], acc["knee_track_dev"]
+    step_width_ratios, stride_len_ratios = acc["step_width_ratios"], acc["stride_len_ratios"]
+    knee_x_offsets = acc["knee_x_offsets"]
 
     # Require enough frames to be meaningful
     if len(front_knee_min_angles) < 3:
         return {"error": "Not enough pose detections to analyze lunges. Try full-body framing, good lighting, and slower reps."}
 
     # --- Aggregate stats across sampled frames ---
-    min_front_knee = float(np.percentile(front_knee_min_angles, 10))     # deeper = smaller
-    med_shin       = float(np.median(shin_angles)) if shin_angles else 0.0
-    med_torso      = float(np.median(torso_angles)) if torso_angles else 0.0
-    max_knee_dev   = float(np.percentile(knee_track_dev, 90)) if knee_track_dev else 0.0
-    med_step_w     = float(np.median(step_width_ratios)) if step_width_ratios else 0.0
-    med_stride_l   = float(np.median(stride_len_ratios)) if stride_len_ratios else 0.0
-    wobble_px_std  = float(np.std(knee_x_offsets)) if len(knee_x_offsets) >= 5 else 0.0
+    min_front_knee = front_knee_min_angles.value()     # deeper = smaller
+    med_shin       = shin_angles.value() if len(shin_angles) else 0.0
+    med_torso      = torso_angles.value() if len(torso_angles) else 0.0
+    max_knee_dev   = knee_track_dev.value() if len(knee_track_dev) else 0.0
+    med_step_w     = step_width_ratios.value() if len(step_width_ratios) else 0.0
+    med_stride_l   = stride_len_ratios.value() if len(stride_len_ratios) else 0.0
+    wobble_px_std  = knee_x_offsets.std if len(knee_x_offsets) >= 5 else 0.0
 
     # Normalize wobble by image width
     wobble_norm = wobble_px_std / (width + 1e-6)
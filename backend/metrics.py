@@ -0,0 +1,223 @@
+# metrics.py
+"""
+Request and pipeline metrics in Prometheus text format (GET /metrics).
+
+Histograms and counters live in this process; with METRICS_DIR set (serve.py
+sets it for its workers) every process also writes a snapshot there, from
+a background thread at most every METRICS_SAVE_S after new observations
+(and on exit, see serve.py), and render() sums the snapshots, so any
+worker can answer a scrape for the whole server. Snapshots of exited processes keep counting
+towards histograms and counters (they are cumulative) while their gauges
+are dropped. Collectors (see add_collector) report per-process gauges,
+labeled by pid when METRICS_DIR is set.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+# Seconds between snapshot writes while observations keep coming in.
+METRICS_SAVE_S = float(os.environ.get("METRICS_SAVE_S", 1.0))
+
+# Seconds; stages span sub-millisecond scoring to minute-long inference.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0)
+
+# Pipeline stats keys (PoseStream.stats() and friends) -> stage label.
+STAGE_KEYS = {"open_s": "open", "decode_s": "decode", "resize_s": "resize", "convert_s": "convert",
+              "infer_s": "infer", "geometry_s": "geometry", "score_s": "score"}
+FRAME_KEYS = {"decoded": "decoded", "sampled": "sampled", "detected": "detected"}
+
+HELP = {
+    "mais_stage_seconds": ("histogram", "Time per analysis spent in each pipeline stage."),
+    "mais_analysis_seconds": ("histogram", "Wall time of one analysis (pose pass and report)."),
+    "mais_request_seconds": ("histogram", "Wall time of an upload request until its response starts."),
+    "mais_upload_seconds": ("histogram", "Time to receive (or spool) and hash an uploaded video."),
+    "mais_frames_total": ("counter", "Video frames decoded, sampled for inference and with a pose detected."),
+    "mais_analyses_total": ("counter", "Analyses by outcome (ok, error, or landmark cache hit)."),
+}
+
+def _labels(labels):
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR, buckets=BUCKETS, save_s=METRICS_SAVE_S):
+        self.directory = directory
+        self.buckets = buckets
+        self.save_s = save_s
+        self._lock = threading.Lock()
+        self._hist = {}       # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}   # (name, labels) -> value
+        self._collectors = []
+        self._dirty = threading.Event()
+        self._saver_pid = None
+
+    # ---------- recording ----------
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+        self._changed()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._changed()
+
+    def observe_analysis(self, exercise, stats, seconds, error=False):
+        """One analysis: its pipeline stats dict (run_pose_pass's `stats`) and wall time."""
+        for key, stage in STAGE_KEYS.items():
+            if key in stats:
+                self.observe("mais_stage_seconds", stats[key], exercise=exercise, stage=stage)
+        hit = stats.get("cache") == "hit"
+        for key, kind in FRAME_KEYS.items():
+            if stats.get(key) and not hit:   # a landmark cache hit decodes nothing
+                self.inc("mais_frames_total", stats[key], exercise=exercise, kind=kind)
+        outcome = "error" if error else "cache_hit" if hit else "ok"
+        self.inc("mais_analyses_total", exercise=exercise, outcome=outcome)
+        self.observe("mais_analysis_seconds", seconds, exercise=exercise)
+
+    def observe_request(self, endpoint, status, seconds):
+        self.observe("mais_request_seconds", seconds, endpoint=endpoint, status=str(status))
+
+    def add_collector(self, collect):
+        """collect() -> [(name, help, value), ...] gauges, read at scrape time."""
+        self._collectors.append(collect)
+
+    # ---------- snapshots ----------
+    def snapshot(self):
+        with self._lock:
+            hist = [[name, list(labels), list(h)] for (name, labels), h in self._hist.items()]
+            counters = [[name, list(labels), v] for (name, labels), v in self._counters.items()]
+        gauges = [[name, help, value] for collect in self._collectors for name, help, value in collect()]
+        return {"pid": os.getpid(), "time": time.time(), "buckets": list(self.buckets),
+                "hist": hist, "counters": counters, "gauges": gauges}
+
+    def _changed(self):
+        if not self.directory:
+            return
+        self._dirty.set()
+        # Started lazily, so a process that forks workers starts it in each of them.
+        if self._saver_pid != os.getpid():
+            with self._lock:
+                if self._saver_pid != os.getpid():
+                    self._saver_pid = os.getpid()
+                    threading.Thread(target=self._save_loop, name="metrics-save", daemon=True).start()
+
+    def _save_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.save_s)
+            self.flush()
+
+    def flush(self):
+        """Write the snapshot now if anything changed since the last write."""
+        if self._dirty.is_set():
+            self._dirty.clear()
+            try:
+                self.save()
+            except OSError:
+                self._dirty.set()
+
+    def save(self):
+        if not self.directory:
+            return
+        blob = json.dumps(self.snapshot())
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(blob)
+            os.replace(tmp, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _snapshots(self):
+        own = self.snapshot()
+        if not self.directory:
+            return [own]
+        snaps = [own]
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json") or entry.name == f"{own['pid']}.json":
+                continue
+            try:
+                with open(entry.path) as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snap.get("buckets") != own["buckets"]:
+                continue
+            if not _alive(snap["pid"]):
+                snap["gauges"] = []
+            snaps.append(snap)
+        return snaps
+
+    # ---------- exposition ----------
+    def render(self):
+        snaps = self._snapshots()
+        hist, counters, gauges, gauge_help = {}, {}, {}, {}
+        for snap in snaps:
+            for name, labels, h in snap["hist"]:
+                key = (name, tuple(map(tuple, labels)))
+                total = hist.setdefault(key, [0] * len(h))
+                for i, v in enumerate(h):
+                    total[i] += v
+            for name, labels, v in snap["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + v
+            for name, help, value in snap["gauges"]:
+                labels = (("pid", snap["pid"]),) if self.directory else ()
+                gauges[(name, labels)] = value
+                gauge_help[name] = help
+
+        lines = []
+        for name, (kind, help) in HELP.items():
+            series = sorted((labels, v) for (n, labels), v in (hist if kind == "histogram" else counters).items()
+                            if n == name)
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, v in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_num(v)}")
+                    continue
+                for le, count in zip(self.buckets, v):   # observe() keeps buckets cumulative
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _num(le)),))} {count}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {v[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_num(v[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {v[-1]}")
+        for name in sorted(gauge_help):
+            lines += [f"# HELP {name} {gauge_help[name]}", f"# TYPE {name} gauge"]
+            for (n, labels), value in sorted(gauges.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels(labels)} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+METRICS = Metrics()
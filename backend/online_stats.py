@@ -0,0 +1,139 @@
+# online_stats.py
+"""
+Constant-memory summaries of per-frame metrics.
+
+StreamingQuantile keeps the first `exact` values and answers exactly like
+np.percentile; past that it switches to the P² estimator (Jain & Chlamtac,
+1985), five markers whose heights follow the target quantile as values
+stream by. On rep-like signals it stays within a fraction of a percentile
+rank; a steadily trending stream can pull it further off.
+
+Welford keeps count / mean / sum of squared deviations and folds in whole
+chunks at a time (Chan et al.'s pairwise update).
+"""
+import math
+
+import numpy as np
+
+EXACT_VALUES = 4096
+
+class StreamingQuantile:
+    """The q-th percentile (0-100, as in np.percentile) of everything passed to update()/add()."""
+
+    def __init__(self, q, exact=EXACT_VALUES):
+        self.p = q / 100.0
+        self.count = 0
+        self._buf = np.empty(max(5, int(exact)), dtype=np.float64)
+        self._heights = self._pos = self._want = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def exact(self):
+        return self._buf is not None
+
+    def add(self, value):
+        self.update((value,))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if self._buf is not None:
+            k = min(len(values), len(self._buf) - self.count)
+            self._buf[self.count:self.count + k] = values[:k]
+            self.count += k
+            values = values[k:]
+            if not len(values):
+                return
+            self._start_markers()
+        for x in values.tolist():
+            self._add(x)
+
+    def value(self):
+        if self.count == 0:
+            return float("nan")
+        if self._buf is not None:
+            return float(np.percentile(self._buf[:self.count], self.p * 100))
+        return self._heights[2]
+
+    # ---------- P² ----------
+    def _start_markers(self):
+        # Seed the markers from the exact buffer instead of the first five values.
+        s = np.sort(self._buf[:self.count])
+        m = self.count
+        p = self.p
+        self._dwant = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+        self._want = [1 + (m - 1) * d for d in self._dwant]
+        pos = [1] * 5
+        for i in range(5):
+            lo = pos[i - 1] + 1 if i else 1
+            pos[i] = min(max(int(round(self._want[i])), lo), m - (4 - i))
+        self._pos = pos
+        self._heights = [float(s[n - 1]) for n in pos]
+        self._buf = None
+
+    def _add(self, x):
+        q, n, want = self._heights, self._pos, self._want
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            want[i] += self._dwant[i]
+        self.count += 1
+
+        for i in (1, 2, 3):
+            d = want[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # piecewise-parabolic prediction, linear if it would break ordering
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+class Welford:
+    """Running count, mean and population variance/std (np.var/np.std with ddof=0)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        self.update((value,))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        k = len(values)
+        if not k:
+            return
+        mean_b = float(values.mean())
+        m2_b = float(np.square(values - mean_b).sum())
+        n = self.count + k
+        delta = mean_b - self.mean
+        self.mean += delta * k / n
+        self._m2 += m2_b + delta * delta * self.count * k / n
+        self.count = n
+
+    @property
+    def var(self):
+        return self._m2 / self.count if self.count else float("nan")
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
@@ -0,0 +1,286 @@
+# pipeline.py
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frames import sample_frames, fit_long_side
+from utils import pose_array, N_LANDMARKS
+
+# Pose landmark input is 256x256; 640px on the long side keeps plenty of
+# detail for the detector while cutting 1080p/4K resize+convert cost.
+# POSE_LONG_SIDE=0 feeds full-resolution frames.
+DEFAULT_LONG_SIDE = int(os.environ.get("POSE_LONG_SIDE", 640)) or None
+
+# Sampling is set in time, not frames: SAMPLE_HZ samples per second of video
+# whatever the clip's frame rate, and at most MAX_SAMPLES inference calls per
+# pass; longer clips are sampled more sparsely rather than cut short (see
+# sampling_stride). MAX_SAMPLES=0 removes the budget.
+SAMPLE_HZ = float(os.environ.get("SAMPLE_HZ", 10.0))
+MAX_SAMPLES = int(os.environ.get("MAX_SAMPLES", 1800)) or None
+# Frame rate assumed when the container reports none (or nonsense).
+FALLBACK_FPS = 30.0
+
+# Landmark rows are carved out of blocks this size (see landmark_rows).
+ROW_BLOCK = 256
+
+_DONE = object()
+
+def landmark_rows(block=ROW_BLOCK):
+    """Endless supply of (33, 4) float32 rows, allocated `block` rows at a time."""
+    while True:
+        yield from np.empty((block, N_LANDMARKS, 4), dtype=np.float32)
+
+class PoseStream:
+    """
+    Two-stage decode -> inference pipeline.
+
+    A producer thread pulls (frame_idx, bgr) pairs from `frames`, downsizes
+    them to `long_side` (None keeps full size), converts them to RGB and puts
+    them on a bounded queue; iterating the stream runs
+    pose.process on the caller's thread and yields (frame_idx, result).
+    OpenCV releases the GIL while decoding/converting, so the next frame is
+    being prepared while MediaPipe works on the current one.
+
+    stats() reports per-stage seconds and queue depth:
+      decode_s / resize_s / convert_s
+                                producer time in the reader / resize / cvtColor
+      infer_s                   time inside pose.process
+      producer_wait_s           producer blocked on a full queue (inference bound)
+      consumer_wait_s           consumer blocked on an empty queue (decode bound)
+      max_queue_depth / mean_queue_depth
+    """
+
+    def __init__(self, frames, pose, queue_size=8, long_side=DEFAULT_LONG_SIDE):
+        self.frames = frames
+        self.pose = pose
+        self.long_side = long_side
+        self.queue_size = queue_size
+        self._q = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._error = None
+        self._stats = {
+            "sampled": 0, "inferred": 0,
+            "decode_s": 0.0, "resize_s": 0.0, "convert_s": 0.0, "infer_s": 0.0,
+            "producer_wait_s": 0.0, "consumer_wait_s": 0.0,
+            "max_queue_depth": 0, "mean_queue_depth": 0.0, "wall_s": 0.0,
+        }
+        self._depth_sum = 0
+        self._polls = 0
+        self._t_start = None
+
+    # ---------- producer ----------
+    def _put(self, item):
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._stats["producer_wait_s"] += time.perf_counter() - t0
+
+    def _produce(self):
+        st = self._stats
+        try:
+            it = iter(self.frames)
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    idx, frame = next(it)
+                except StopIteration:
+                    break
+                t1 = time.perf_counter()
+                frame = fit_long_side(frame, self.long_side)
+                t2 = time.perf_counter()
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                t3 = time.perf_counter()
+                st["decode_s"] += t1 - t0
+                st["resize_s"] += t2 - t1
+                st["convert_s"] += t3 - t2
+                st["sampled"] += 1
+                self._put((idx, rgb))
+        except Exception as e:  # surfaced on the consumer side
+            self._error = e
+        finally:
+            self._put(_DONE)
+
+    # ---------- consumer ----------
+    def __iter__(self):
+        self._t_start = time.perf_counter()
+        self._thread = threading.Thread(target=self._produce, name="pose-decode", daemon=True)
+        self._thread.start()
+        st = self._stats
+        try:
+            while True:
+                depth = self._q.qsize()
+                st["max_queue_depth"] = max(st["max_queue_depth"], depth)
+                self._depth_sum += depth
+                self._polls += 1
+                t0 = time.perf_counter()
+                item = self._q.get()
+                st["consumer_wait_s"] += time.perf_counter() - t0
+                if item is _DONE:
+                    break
+                idx, rgb = item
+                t0 = time.perf_counter()
+                res = self.pose.process(rgb)
+                st["infer_s"] += time.perf_counter() - t0
+                st["inferred"] += 1
+                yield idx, res
+            if self._error is not None:
+                raise self._error
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            # Unblock a producer stuck on a full queue, then wait for it.
+            while self._thread.is_alive():
+                try:
+                    self._q.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            self._thread = None
+        if self._t_start is not None:
+            self._stats["wall_s"] = time.perf_counter() - self._t_start
+
+    def stats(self):
+        st = dict(self._stats)
+        st["mean_queue_depth"] = self._depth_sum / self._polls if self._polls else 0.0
+        st["queue_size"] = self.queue_size
+        return st
+
+def video_fps(cap):
+    """cap's frame rate, or FALLBACK_FPS when the container does not report a usable one."""
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+    return fps if 1.0 <= fps <= 1000.0 else FALLBACK_FPS
+
+def sampling_stride(cap, sample_hz=SAMPLE_HZ, max_samples=MAX_SAMPLES):
+    """
+    Frame stride that samples `cap` at about sample_hz, widened so the whole
+    clip fits in max_samples when its length is known. A clip of unknown
+    length keeps the sample_hz stride and is stopped by max_samples instead.
+    """
+    stride = max(1, round(video_fps(cap) / sample_hz)) if sample_hz else 1
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    if max_samples is not None and n > 0:
+        stride = max(stride, -(-n // max_samples))
+    return stride
+
+def expected_samples(cap, stride, max_frames=None, limit_detections=True):
+    """Samples a pass over `cap` should take, or None when the container does not say how long it is."""
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    if n <= 0:
+        return None
+    n = -(-n // max(1, int(stride)))
+    if max_frames is not None and not limit_detections:
+        n = min(n, max_frames)
+    return n
+
+def run_pose_pipeline(cap, pose, on_frame, stride=3, max_frames=600, limit_detections=True,
+                      queue_size=8, long_side=DEFAULT_LONG_SIDE, frame_size=(1, 1), on_sample=None,
+                      progress=None, max_samples=None, deadline=None):
+    """
+    Feed every `stride`-th frame of `cap` through `pose` and call
+    on_frame(landmarks) for each frame with a detection (on_frame may be
+    None), and on_sample(frame_idx, landmarks or None) for every sample.
+
+    landmarks is a (33, 4) float32 [x, y, z, visibility] array (see
+    utils.pose_array) with x/y scaled by frame_size, the original (w, h);
+    frames are downsized to `long_side` before inference, which does not
+    change these coordinates. Rows come from landmark_rows() and stay valid
+    after the call. max_frames caps detected frames (squat/pushup) or, with
+    limit_detections=False, sampled frames (lunge); None reads the whole
+    clip. max_samples is the inference budget: the pass stops before a
+    sample beyond it. progress(done, total), if given, is called after every
+    sample with the samples so far and expected_samples() (an estimate: a
+    pass capped by detections can stop sooner); it may raise (see cancel.py)
+    to abandon the pass, which closes the stream on the way out. deadline, a
+    time.perf_counter() value, stops the pass after the sample that
+    overruns it (`deadline_hit`). Returns PoseStream.stats()
+    plus `processed`, `decoded` (frames pulled from the decoder, skipped
+    ones included), `eof` (the whole clip was consumed rather than stopping
+    at max_frames or max_samples) and `truncated` (max_samples ran out
+    first).
+    """
+    counts = {"decoded": 0}
+    stream = PoseStream(sample_frames(cap, stride, counts=counts), pose,
+                        queue_size=queue_size, long_side=long_side)
+    w, h = frame_size
+    rows = landmark_rows()
+    total = expected_samples(cap, stride, max_frames, limit_detections) if progress is not None else None
+    if total is not None and max_samples is not None:
+        total = min(total, max_samples)
+    processed = 0
+    done = 0
+    eof = True
+    truncated = False
+    deadline_hit = False
+    try:
+        for idx, res in stream:
+            if max_samples is not None and done >= max_samples:
+                eof = False
+                truncated = True
+                break
+            done += 1
+            if not limit_detections:
+                processed += 1
+            if res.pose_landmarks:
+                if limit_detections:
+                    processed += 1
+                lms = pose_array(res.pose_landmarks, w, h, out=next(rows))
+                if on_sample is not None:
+                    on_sample(idx, lms)
+                if on_frame is not None:
+                    on_frame(lms)
+            elif on_sample is not None:
+                on_sample(idx, None)
+            if progress is not None:
+                progress(done, total)
+            if max_frames is not None and processed >= max_frames:
+                eof = False
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                eof = False
+                deadline_hit = True
+                break
+    finally:
+        stream.close()
+    stats = stream.stats()
+    stats["processed"] = processed
+    stats["decoded"] = counts["decoded"]
+    stats["eof"] = eof
+    stats["truncated"] = truncated
+    stats["deadline_hit"] = deadline_hit
+    return stats
+
+def replay_covers(detected, complete, max_frames=600, limit_detections=True):
+    """Whether a recorded run (per-sample detection mask) holds everything a run with these limits would see."""
+    if complete:
+        return True
+    have = int(np.count_nonzero(detected)) if limit_detections else len(detected)
+    return max_frames is not None and have >= max_frames
+
+def replay_landmarks(landmarks, detected, on_frame, max_frames=600, limit_detections=True):
+    """
+    run_pose_pipeline over recorded landmarks instead of video: same
+    max_frames semantics, on_frame gets the recorded (33, 4) rows. Returns
+    the number of processed samples.
+    """
+    processed = 0
+    for lm_arr, hit in zip(landmarks, detected):
+        if not limit_detections:
+            processed += 1
+        if hit:
+            if limit_detections:
+                processed += 1
+            on_frame(lm_arr)
+        if max_frames is not None and processed >= max_frames:
+            break
+    return processed
@@ -0,0 +1,139 @@
+# pose_pool.py
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils import make_pose
+from cancel import Cancelled
+
+# One graph per concurrently analyzed video; defaults to the core count.
+POOL_SIZE = int(os.environ.get("POSE_POOL_SIZE", 0)) or (os.cpu_count() or 1)
+
+_BLANK = np.zeros((256, 256, 3), dtype=np.uint8)
+
+class PosePool:
+    """
+    Pre-initialized MediaPipe Pose instances shared across requests.
+
+    checkout() hands out an idle instance (a hit), builds a new one while
+    fewer than `size` exist (a miss), or blocks until one is returned (a
+    wait). Returned instances are reset and primed with a blank frame on a
+    background thread, so the next video starts with fresh tracking state and
+    without paying calculator start-up on its first frame. Instances that
+    raised mid-analysis are closed instead of reused; a cancelled analysis
+    (cancel.Cancelled, raised between frames) returns its instance as usual.
+    """
+
+    def __init__(self, size=POOL_SIZE, factory=make_pose):
+        self.size = max(1, int(size))
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._recycle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._recycler = None
+        self._stats = {"checkouts": 0, "hits": 0, "misses": 0, "waits": 0,
+                       "wait_s": 0.0, "max_wait_s": 0.0, "discarded": 0}
+
+    def _prime(self, pose):
+        pose.process(_BLANK)
+        return pose
+
+    def warm(self):
+        """Build and prime every instance up front (call at server start)."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._prime(self._factory()))
+
+    def _acquire(self, timeout):
+        try:
+            pose = self._idle.get_nowait()
+            with self._lock:
+                self._stats["hits"] += 1
+            return pose
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = self._created < self.size
+            if grow:
+                self._created += 1
+                self._stats["misses"] += 1
+        if grow:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        t0 = time.perf_counter()
+        pose = self._idle.get(timeout=timeout)   # raises queue.Empty on timeout
+        waited = time.perf_counter() - t0
+        with self._lock:
+            self._stats["waits"] += 1
+            self._stats["wait_s"] += waited
+            self._stats["max_wait_s"] = max(self._stats["max_wait_s"], waited)
+        return pose
+
+    def _release(self, pose, ok):
+        if not ok:
+            try:
+                pose.close()
+            finally:
+                with self._lock:
+                    self._created -= 1
+                    self._stats["discarded"] += 1
+            return
+        with self._lock:
+            if self._recycler is None:
+                self._recycler = threading.Thread(target=self._recycle_loop, name="pose-recycle", daemon=True)
+                self._recycler.start()
+        self._recycle.put(pose)
+
+    def _recycle_loop(self):
+        while True:
+            pose = self._recycle.get()
+            try:
+                pose.reset()
+                self._idle.put(self._prime(pose))
+            except Exception:
+                try:
+                    pose.close()
+                except Exception:
+                    pass
+                with self._lock:
+                    self._created -= 1
+                    self._stats["discarded"] += 1
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        pose = self._acquire(timeout)
+        with self._lock:
+            self._stats["checkouts"] += 1
+        ok = False
+        try:
+            yield pose
+            ok = True
+        except Cancelled:
+            ok = True
+            raise
+        finally:
+            self._release(pose, ok)
+
+    def stats(self):
+        with self._lock:
+            st = dict(self._stats)
+            st["size"] = self.size
+            st["created"] = self._created
+        st["idle"] = self._idle.qsize()
+        st["recycling"] = self._recycle.qsize()
+        st["in_use"] = max(0, st["created"] - st["idle"] - st["recycling"])
+        return st
+
+POSE_POOL = PosePool()
@@ -0,0 +1,66 @@
+# profiling.py
+"""
+Opt-in profiling of single analyses (profile=1 on /api/analyze).
+
+Only clients in PROFILE_ALLOW (comma-separated addresses, as app.client_id
+sees them) may ask, or anyone with PROFILE_ENABLED=1. run_profiled() runs
+the analysis under cProfile and returns a compact breakdown: the top
+functions by cumulative time and the full .prof dump's name in PROFILE_DIR
+(open with `python -m pstats` or snakeviz). cProfile only sees the calling
+thread; the PoseStream decode thread shows up in the per-stage wall times
+(stage_times) instead. One profile runs at a time. Requests without
+profile=1 never reach this module.
+"""
+import cProfile
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "0") == "1"
+PROFILE_ALLOW = {a.strip() for a in os.environ.get("PROFILE_ALLOW", "").split(",") if a.strip()}
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "mais-profiles")
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", 25))
+
+_lock = threading.Lock()
+
+class ProfileDenied(Exception):
+    pass
+
+def check_profile(client):
+    """Raise ProfileDenied unless `client` may profile."""
+    if not (PROFILE_ENABLED or client in PROFILE_ALLOW):
+        raise ProfileDenied("Profiling is not enabled for this client.")
+
+def stage_times(stats):
+    """Per-stage wall seconds and frame counts from a pipeline stats dict."""
+    out = {k: round(v, 4) for k, v in stats.items() if k.endswith("_s") and isinstance(v, float)}
+    out.update({k: stats[k] for k in ("decoded", "sampled", "inferred", "detected", "cache") if k in stats})
+    return out
+
+def top_functions(profile, limit=PROFILE_TOP):
+    st = pstats.Stats(profile).sort_stats(pstats.SortKey.CUMULATIVE)
+    top = []
+    for func in st.fcn_list[:limit]:
+        _, calls, tottime, cumtime, _ = st.stats[func]
+        filename, line, name = func
+        where = f"{os.path.basename(filename)}:{line}" if line else filename
+        top.append({"function": f"{where}({name})", "calls": calls,
+                    "tottime_s": round(tottime, 4), "cumtime_s": round(cumtime, 4)})
+    return top
+
+def run_profiled(label, fn, *args, **kwargs):
+    """(fn(*args, **kwargs), breakdown) with fn run under cProfile and the dump saved to PROFILE_DIR."""
+    profile = cProfile.Profile()
+    with _lock:
+        t0 = time.perf_counter()
+        result = profile.runcall(fn, *args, **kwargs)
+        wall = time.perf_counter() - t0
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    label = re.sub(r"[^a-z0-9,_-]", "_", str(label).lower())[:40]
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}.prof"
+    profile.dump_stats(os.path.join(PROFILE_DIR, name))
+    return result, {"wall_s": round(wall, 4), "dump": name, "top": top_functions(profile)}
@@ -0,0 +1,110 @@
+# progressive.py
+"""
+Anytime pose sampling for analyses with a deadline.
+
+The uniform sample grid (every `stride`-th frame, as sample_frames takes it)
+is visited coarse to fine: level 0 takes every 2**(levels-1)-th grid point
+across the whole clip and each later level fills in the points halfway
+between those already taken. Whenever the deadline cuts the pass short,
+the samples so far are spread over the clip rather than bunched at its
+start; a pass that finishes has taken exactly the uniform grid. Levels
+after the first seek back, so the clip must be seekable and of known
+length.
+"""
+import time
+
+from frames import frames_at
+from pipeline import PoseStream, landmark_rows, DEFAULT_LONG_SIDE
+from utils import pose_array
+
+# Grid density doubles per level: 3 levels start at every 4th grid point.
+PROGRESSIVE_LEVELS = 3
+
+def progressive_levels(n_frames, stride, levels=PROGRESSIVE_LEVELS):
+    """Ascending frame-index lists, coarse to fine, that together are the uniform grid of an n_frames clip."""
+    grid = range(max(1, int(stride)) - 1, n_frames, max(1, int(stride)))
+    step = 2 ** (max(1, int(levels)) - 1)
+    plan = [list(grid[::step])]
+    while step > 1:
+        plan.append(list(grid[step // 2::step]))
+        step //= 2
+    return [indices for indices in plan if indices]
+
+def run_progressive_pose_pipeline(cap, pose, on_sample, n_frames, deadline, stride=3, levels=PROGRESSIVE_LEVELS,
+                                  queue_size=8, long_side=DEFAULT_LONG_SIDE, frame_size=(1, 1), progress=None,
+                                  clock=time.perf_counter):
+    """
+    Sample `cap` coarse to fine (see progressive_levels) until done or
+    clock() passes `deadline`, calling on_sample(frame_idx, landmarks or
+    None) per sample in visiting order (not frame order); landmarks are
+    rows as in run_pose_pipeline. The deadline is checked after every
+    sample, so a pass can overrun it by one inference call. progress(done,
+    total) counts samples against the whole plan.
+
+    Returns merged PoseStream stats plus `processed`, `decoded`, `planned`
+    (samples in the plan), `coverage` (processed / planned), `span` (share
+    of the clip the coarse level reached), `levels_done`, `deadline_hit`,
+    `read_failed` (the pass ended in time but short of the plan: frames
+    that could not be sought or decoded, or fewer than the container
+    claims), `eof` (every planned sample was taken) and `truncated`
+    (always False: the stride already fits the budget).
+    """
+    plan = progressive_levels(n_frames, stride, levels)
+    planned = sum(map(len, plan))
+    counts = {"decoded": 0}
+    w, h = frame_size
+    rows = landmark_rows()
+    done = 0
+    levels_done = 0
+    reached = -1
+    hit = False
+    stats = {}
+    for level, indices in enumerate(plan):
+        if clock() >= deadline:
+            hit = True
+            break
+        stream = PoseStream(frames_at(cap, indices, counts=counts), pose, queue_size=queue_size,
+                            long_side=long_side)
+        taken = 0
+        try:
+            for idx, res in stream:
+                taken += 1
+                lms = pose_array(res.pose_landmarks, w, h, out=next(rows)) if res.pose_landmarks else None
+                on_sample(idx, lms)
+                done += 1
+                if level == 0:
+                    reached = idx
+                if progress is not None:
+                    progress(done, planned)
+                if clock() >= deadline:
+                    hit = True
+                    break
+            else:
+                levels_done += taken == len(indices)
+        finally:
+            stream.close()
+        for k, v in stream.stats().items():
+            if k.endswith("_s") or k in ("sampled", "inferred"):
+                stats[k] = stats.get(k, 0) + v
+            elif k == "max_queue_depth":
+                stats[k] = max(stats.get(k, 0), v)
+            else:
+                stats.setdefault(k, v)
+        if hit:
+            break
+
+    complete = done >= planned
+    stats.update({
+        "sampling": "progressive",
+        "processed": done,
+        "decoded": counts["decoded"],
+        "planned": planned,
+        "coverage": round(done / planned, 3) if planned else 1.0,
+        "span": 1.0 if levels_done or complete else round((reached + 1) / n_frames, 3),
+        "levels_done": levels_done,
+        "deadline_hit": hit and not complete,
+        "read_failed": not hit and not complete,
+        "eof": complete,
+        "truncated": False,
+    })
+    return stats
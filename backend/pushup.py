@@ -1,82 +1,88 @@
-import cv2
 import numpy as np
 from utils import (
-    make_pose, angle_3pts, dist_point_to_line, lm_xy, choose_side_for_arm
+    LEFT, RIGHT, angle_3pts, choose_side_for_arm, landmarks_xy, side_points, norms,
+    angle_3pts_batch, dist_point_to_line_batch,
 )
-import mediapipe as mp
-L = mp.solutions.pose.PoseLandmark
+from pipeline import DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES
+from analysis import run_pose_pass, MetricStream, finish_report, add_rep_bottoms
+from online_stats import StreamingQuantile
+
+def new_pushup_acc():
+    return MetricStream(pushup_metrics, {
+        "elbow_angles": StreamingQuantile(10),
+        "body_dev": StreamingQuantile(50),
+        "neck_tilt": StreamingQuantile(50),
+        "hand_offset": StreamingQuantile(50),
+    })
+
+def pushup_metrics(lm):
+    """Per-frame push-up metrics for stacked pixel-space landmarks lm (N, 33, 4), as 1-D arrays of valid values."""
+    xy = landmarks_xy(lm)
+    left = choose_side_for_arm(lm)
+
+    shoulder = side_points(xy, left, LEFT.shoulder, RIGHT.shoulder)
+    elbow    = side_points(xy, left, LEFT.elbow, RIGHT.elbow)
+    wrist    = side_points(xy, left, LEFT.wrist, RIGHT.wrist)
+    hip_pt   = side_points(xy, left, LEFT.hip, RIGHT.hip)
+    ankle    = side_points(xy, left, LEFT.ankle, RIGHT.ankle)
+    ear_pt   = side_points(xy, left, LEFT.ear, RIGHT.ear)
+
+    e_ang = angle_3pts_batch(shoulder, elbow, wrist)  # elbow depth
+    dev_norm = dist_point_to_line_batch(hip_pt, shoulder, ankle) / (norms(shoulder - ankle) + 1e-6)
+
+    # neck tilt vs horizontal
+    v = ear_pt - shoulder
+    v_len = norms(v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        neck_deg = np.abs(np.degrees(np.arccos(np.clip(v[:, 0] / v_len, -1.0, 1.0))))
+
+    upper_arm_len = norms(shoulder - elbow) + 1e-6
+    hand_off = np.abs(wrist[:, 0] - shoulder[:, 0]) / upper_arm_len
 
-def analyze_pushup_video(video_path, max_frames=600, stride=3):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+    return {
+        "elbow_angles": e_ang[~np.isnan(e_ang)],
+        "body_dev": dev_norm[~np.isnan(dev_norm)],
+        "neck_tilt": neck_deg[v_len > 0],
+        "hand_offset": hand_off,
+    }
+
+def pushup_depth_angle(lm):
+    """Elbow angle of the more visible arm (the adaptive sampler's depth signal)."""
+    j = LEFT if choose_side_for_arm(lm) else RIGHT
+    xy = landmarks_xy(lm)
+    return angle_3pts(xy[j.shoulder], xy[j.elbow], xy[j.wrist])
+
+def analyze_pushup_video(video_path, max_frames=None, stride=None, stats=None, long_side=DEFAULT_LONG_SIDE,
+                         sampling="uniform", digest=None, progress=None, sample_hz=SAMPLE_HZ,
+                         max_samples=MAX_SAMPLES):
+    acc = new_pushup_acc()
+    bottoms = []
+    size = run_pose_pass(
+        video_path, acc.add,
+        stride=stride, max_frames=max_frames, long_side=long_side, sampling=sampling,
+        signal=pushup_depth_angle, on_extreme=bottoms.append, digest=digest, stats=stats,
+        progress=progress, sample_hz=sample_hz, max_samples=max_samples)
+    if size is None:
         return {"error": "Could not open video."}
 
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1920)
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1080)
-
-    pose = make_pose()
-
-    elbow_angles, body_dev, neck_tilt, hand_offset = [], [], [], []
-    processed = 0; frame_idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        frame_idx += 1
-        if frame_idx % stride != 0: continue
-        if processed >= max_frames: break
-
-        res = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        if not res.pose_landmarks: continue
-        processed += 1
-
-        lms = res.pose_landmarks.landmark
-        side = choose_side_for_arm(lms)
-
-        if side == 'left':
-            sh, el, wr, hip, an, ear = L.LEFT_SHOULDER, L.LEFT_ELBOW, L.LEFT_WRIST, L.LEFT_HIP, L.LEFT_ANKLE, L.LEFT_EAR
-        else:
-            sh, el, wr, hip, an, ear = L.RIGHT_SHOULDER, L.RIGHT_ELBOW, L.RIGHT_WRIST, L.RIGHT_HIP, L.RIGHT_ANKLE, L.RIGHT_EAR
-
-        shoulder = lm_xy(lms, sh.value, w, h)
-        elbow    = lm_xy(lms, el.value, w, h)
-        wrist    = lm_xy(lms, wr.value, w, h)
-        hip_pt   = lm_xy(lms, hip.value, w, h)
-        ankle    = lm_xy(lms, an.value, w, h)
-        ear_pt   = lm_xy(lms, ear.value, w, h)
-
-        e_ang = angle_3pts(shoulder, elbow, wrist)  # elbow depth
-        dev   = dist_point_to_line(hip_pt, shoulder, ankle)
-        sa_len = np.linalg.norm(np.array(shoulder) - np.array(ankle)) + 1e-6
-        dev_norm = dev / sa_len if dev is not None else None
-
-        # neck tilt vs horizontal
-        v = np.array([ear_pt[0] - shoulder[0], ear_pt[1] - shoulder[1]])
-        if np.linalg.norm(v) > 0:
-            horiz = np.array([1.0, 0.0])
-            cosang = np.dot(v, horiz) / (np.linalg.norm(v) * np.linalg.norm(horiz))
-            cosang = np.clip(cosang, -1.0, 1.0)
-            neck_deg = float(abs(np.degrees(np.arccos(cosang))))
-        else:
-            neck_deg = None
-
-        upper_arm_len = np.linalg.norm(np.array(shoulder) - np.array(elbow)) + 1e-6
-        hand_off = abs(wrist[0] - shoulder[0]) / upper_arm_len
-
-        if e_ang is not None: elbow_angles.append(e_ang)
-        if dev_norm is not None: body_dev.append(dev_norm)
-        if neck_deg is not None: neck_tilt.append(neck_deg)
-        hand_offset.append(hand_off)
-
-    cap.release(); pose.close()
+    return add_rep_bottoms(finish_report(pushup_report, acc, size, stats), "elbow_depth", bottoms)
+
+def pushup_report(acc, size):
+    """Final report from an accumulator a pose pass over a (w, h) = size video has fed."""
+    acc.flush()
+    return score_pushup(acc)
+
+def score_pushup(acc):
+    elbow_angles, body_dev = acc["elbow_angles"], acc["body_dev"]
+    neck_tilt, hand_offset = acc["neck_tilt"], acc["hand_offset"]
 
     if len(elbow_angles) < 3:
         return {"error": "Not enough pose detections for push-up. Use a side view and good lighting."}
 
-    min_elbow   = float(np.percentile(elbow_angles, 10))
-    med_dev     = float(np.median(body_dev)) if body_dev else 0.0
-    med_neck    = float(np.median(neck_tilt)) if neck_tilt else 0.0
-    med_hand    = float(np.median(hand_offset)) if hand_offset else 0.0
+    min_elbow   = elbow_angles.value()
+    med_dev     = body_dev.value() if len(body_dev) else 0.0
+    med_neck    = neck_tilt.value() if len(neck_tilt) else 0.0
+    med_hand    = hand_offset.value() if len(hand_offset) else 0.0
 
     elbow_score = 95 if min_elbow <= 70 else 85 if min_elbow <= 90 else 70 if min_elbow <= 110 else 55
     body_score  = 95 if med_dev <= 0.04 else 82 if med_dev <= 0.07 else 68 if med_dev <= 0.12 else 50
@@ -0,0 +1,142 @@
+# result_cache.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from landmark_cache import CACHE_VERSION
+
+# Bump when scoring or report wording changes (landmark changes already bump
+# CACHE_VERSION, which is part of every key).
+RESULT_VERSION = 1
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 512))
+
+class Uncacheable(Exception):
+    """Raised by a run() compute to hand back `result` without storing or sharing it."""
+
+    def __init__(self, result):
+        super().__init__("result not cacheable")
+        self.result = result
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.stored = False
+
+class ResultCache:
+    """
+    Finished analysis reports, keyed by upload hash + request parameters.
+
+    run(key, compute) returns a stored report at once ("hit"), waits for an
+    identical computation already in progress ("coalesced"), or computes,
+    stores and returns it ("computed"). A compute that raises is not stored;
+    requests coalesced onto it get the same exception. One that raises
+    Uncacheable(result) returns that result to its own caller ("uncached")
+    and nobody else: requests coalesced onto it compute (or join) anew.
+    pending(key) tells whether run(key) would get away without computing.
+    Least recently used
+    reports are dropped beyond max_entries; max_entries=0 disables caching
+    and coalescing. The key doubles as the report's ETag, since the same
+    inputs give the same report.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, digest, **params):
+        blob = json.dumps({"v": RESULT_VERSION, "landmarks": CACHE_VERSION, "video": digest, **params},
+                          sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    @staticmethod
+    def etag(key):
+        return f'"{key}"'
+
+    def get(self, key):
+        """The stored report, or None (no side effects on stats)."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def pending(self, key):
+        """Whether `key` is stored or being computed."""
+        with self._lock:
+            return key in self._entries or key in self._flights
+
+    def run(self, key, compute):
+        """(result, "hit" | "coalesced" | "computed" | "uncached")."""
+        if not self.enabled:
+            try:
+                return compute(), "computed"
+            except Uncacheable as e:
+                return e.result, "uncached"
+        while True:
+            with self._lock:
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return result, "hit"
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self._stats["misses"] += 1
+                else:
+                    self._stats["coalesced"] += 1
+            if not leader:
+                flight.done.wait()
+                if flight.error is not None:
+                    raise flight.error
+                if flight.stored:
+                    return flight.result, "coalesced"
+                continue
+            try:
+                flight.result = compute()
+                self.put(key, flight.result)
+                flight.stored = True
+                return flight.result, "computed"
+            except Uncacheable as e:
+                return e.result, "uncached"
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            st = dict(self._stats)
+            st["entries"] = len(self._entries)
+            st["in_flight"] = len(self._flights)
+        st["max_entries"] = self.max_entries
+        return st
+
+RESULT_CACHE = ResultCache()
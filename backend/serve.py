@@ -0,0 +1,96 @@
+# serve.py
+"""
+Production server: gunicorn with one pre-forked worker process per core.
+
+    python serve.py
+
+The master imports the app (mediapipe, cv2, numpy) before forking, so the
+libraries are loaded once and shared copy-on-write. It must not build a
+Pose graph: a child forked after that aborts on its first graph (heap
+corruption). Each worker instead warms its own Pose pool and starts its job
+workers before /api/ready reports it. Pose inference is CPU bound, so
+scaling comes from processes: POSE_POOL_SIZE defaults to 1 per worker here,
+and the result cache and admission limits are per process.
+
+On SIGTERM a worker drains: /api/ready answers 503 for DRAIN_S so load
+balancers stop routing to it, then it stops accepting and in-flight
+requests get the rest of GRACEFUL_TIMEOUT to finish. Background jobs it
+had not started stay queued on disk for the next start.
+
+Workers share metrics through METRICS_DIR (emptied at start), so /metrics
+reports the whole server whichever worker answers.
+"""
+import glob
+import os
+import signal
+import tempfile
+import threading
+
+from gunicorn.app.base import BaseApplication
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", 5000))
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", 0)) or (os.cpu_count() or 1)
+# Request threads per worker: analyses waiting for admission, NDJSON streams,
+# job polls and live sockets each hold one.
+THREADS = int(os.environ.get("WEB_THREADS", 8))
+DRAIN_S = float(os.environ.get("DRAIN_S", 5))
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", 60))
+
+def post_fork(server, worker):
+    # One OpenCV thread per process; parallelism comes from the worker count.
+    import cv2
+    cv2.setNumThreads(1)
+
+def post_worker_init(worker):
+    from app import start_serving, drain
+
+    def on_term(sig, frame):
+        worker.log.info("worker %s draining for %.0fs", worker.pid, DRAIN_S)
+        drain()
+        threading.Timer(DRAIN_S, worker.handle_exit, (sig, frame)).start()
+
+    start_serving()
+    signal.signal(signal.SIGTERM, on_term)
+
+def worker_exit(server, worker):
+    # Snapshots are written in the background; don't lose the last second.
+    from metrics import METRICS
+    METRICS.flush()
+
+class Server(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Runs once in the master (preload_app).
+        from app import app
+        return app
+
+def reset_metrics_dir():
+    directory = os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"mais-metrics-{PORT}"))
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+if __name__ == "__main__":
+    os.environ.setdefault("POSE_POOL_SIZE", "1")
+    reset_metrics_dir()
+    Server({
+        "bind": f"{HOST}:{PORT}",
+        "workers": WORKERS,
+        "worker_class": "gthread",
+        "threads": THREADS,
+        "preload_app": True,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "accesslog": "-",
+        "pidfile": os.environ.get("PIDFILE"),
+    }).run()
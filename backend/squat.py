@@ -1,78 +1,85 @@
-import cv2
 import numpy as np
 from utils import (
-    make_pose, angle_3pts, angle_to_vertical, dist_point_to_line,
-    lm_xy, choose_side_for_leg
+    LEFT, RIGHT, angle_3pts, choose_side_for_leg, landmarks_xy, side_points, norms,
+    angle_3pts_batch, angle_to_vertical_batch, dist_point_to_line_batch,
 )
-import mediapipe as mp
-L = mp.solutions.pose.PoseLandmark
+from pipeline import DEFAULT_LONG_SIDE, SAMPLE_HZ, MAX_SAMPLES
+from analysis import run_pose_pass, MetricStream, finish_report, add_rep_bottoms
+from online_stats import StreamingQuantile
+
+def new_squat_acc():
+    return MetricStream(squat_metrics, {
+        "knee_angles": StreamingQuantile(10),
+        "torso_angles": StreamingQuantile(50),
+        "knee_valgus_dev": StreamingQuantile(90),
+        "ankle_dorsi": StreamingQuantile(90),
+    })
+
+def squat_metrics(lm):
+    """Per-frame squat metrics for stacked pixel-space landmarks lm (N, 33, 4), as 1-D arrays of valid values."""
+    xy = landmarks_xy(lm)
+    left = choose_side_for_leg(lm)
+
+    hip      = side_points(xy, left, LEFT.hip, RIGHT.hip)
+    knee     = side_points(xy, left, LEFT.knee, RIGHT.knee)
+    ankle    = side_points(xy, left, LEFT.ankle, RIGHT.ankle)
+    shoulder = side_points(xy, left, LEFT.shoulder, RIGHT.shoulder)
+    toe      = side_points(xy, left, LEFT.foot_index, RIGHT.foot_index)
+
+    k_ang = angle_3pts_batch(hip, knee, ankle)
+    h_ang = angle_3pts_batch(shoulder, hip, knee)
+    t_ang = angle_to_vertical_batch(shoulder, hip)
+    a_ang = angle_3pts_batch(knee, ankle, toe)  # dorsiflex proxy
+    ok = ~(np.isnan(k_ang) | np.isnan(h_ang) | np.isnan(t_ang) | np.isnan(a_ang))
+
+    dev = dist_point_to_line_batch(knee, ankle, toe)
+    thigh_len = norms(hip - knee) + 1e-6
+    return {
+        "knee_angles": k_ang[ok],
+        "hip_angles": h_ang[ok],
+        "torso_angles": t_ang[ok],
+        "ankle_dorsi": 180 - a_ang[ok],
+        "knee_valgus_dev": (dev / thigh_len)[~np.isnan(dev)],
+        "hip_vs_knee_y": hip[:, 1] - knee[:, 1],
+    }
 
-def analyze_squat_video(video_path, max_frames=600, stride=3):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+def squat_depth_angle(lm):
+    """Knee angle of the more visible leg (the adaptive sampler's depth signal)."""
+    j = LEFT if choose_side_for_leg(lm) else RIGHT
+    xy = landmarks_xy(lm)
+    return angle_3pts(xy[j.hip], xy[j.knee], xy[j.ankle])
+
+def analyze_squat_video(video_path, max_frames=None, stride=None, stats=None, long_side=DEFAULT_LONG_SIDE,
+                        sampling="uniform", digest=None, progress=None, sample_hz=SAMPLE_HZ,
+                        max_samples=MAX_SAMPLES):
+    acc = new_squat_acc()
+    bottoms = []
+    size = run_pose_pass(
+        video_path, acc.add,
+        stride=stride, max_frames=max_frames, long_side=long_side, sampling=sampling,
+        signal=squat_depth_angle, on_extreme=bottoms.append, digest=digest, stats=stats,
+        progress=progress, sample_hz=sample_hz, max_samples=max_samples)
+    if size is None:
         return {"error": "Could not open video."}
 
-    w  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1920)
-    h  = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1080)
-
-    pose = make_pose()
-
-    knee_angles, hip_angles, torso_angles, ankle_dorsi = [], [], [], []
-    knee_valgus_dev, hip_vs_knee_y = [], []
-
-    processed = 0; frame_idx = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        frame_idx += 1
-        if frame_idx % stride != 0: continue
-        if processed >= max_frames: break
-
-        res = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        if not res.pose_landmarks: continue
-        processed += 1
-
-        lms = res.pose_landmarks.landmark
-        side = choose_side_for_leg(lms)
-
-        if side == 'left':
-            hip_i, knee_i, ankle_i, sh_i, toe_i = L.LEFT_HIP, L.LEFT_KNEE, L.LEFT_ANKLE, L.LEFT_SHOULDER, L.LEFT_FOOT_INDEX
-        else:
-            hip_i, knee_i, ankle_i, sh_i, toe_i = L.RIGHT_HIP, L.RIGHT_KNEE, L.RIGHT_ANKLE, L.RIGHT_SHOULDER, L.RIGHT_FOOT_INDEX
-
-        hip     = lm_xy(lms, hip_i.value, w, h)
-        knee    = lm_xy(lms, knee_i.value, w, h)
-        ankle   = lm_xy(lms, ankle_i.value, w, h)
-        shoulder= lm_xy(lms, sh_i.value,  w, h)
-        toe     = lm_xy(lms, toe_i.value, w, h)
-
-        k_ang = angle_3pts(hip, knee, ankle)
-        h_ang = angle_3pts(shoulder, hip, knee)
-        t_ang = angle_to_vertical(shoulder, hip)
-        a_ang = angle_3pts(knee, ankle, toe)  # dorsiflex proxy
-
-        if all(v is not None for v in [k_ang, h_ang, t_ang, a_ang]):
-            knee_angles.append(k_ang)
-            hip_angles.append(h_ang)
-            torso_angles.append(t_ang)
-            ankle_dorsi.append(180 - a_ang)
+    return add_rep_bottoms(finish_report(squat_report, acc, size, stats), "depth", bottoms)
 
-        dev = dist_point_to_line(knee, ankle, toe)
-        if dev is not None:
-            thigh_len = np.linalg.norm(np.array(hip) - np.array(knee)) + 1e-6
-            knee_valgus_dev.append(dev / thigh_len)
-        hip_vs_knee_y.append(hip[1] - knee[1])
+def squat_report(acc, size):
+    """Final report from an accumulator a pose pass over a (w, h) = size video has fed."""
+    acc.flush()
+    return score_squat(acc)
 
-    cap.release(); pose.close()
+def score_squat(acc):
+    knee_angles, torso_angles = acc["knee_angles"], acc["torso_angles"]
+    knee_valgus_dev, ankle_dorsi = acc["knee_valgus_dev"], acc["ankle_dorsi"]
 
     if len(knee_angles) < 3:
         return {"error": "Not enough pose detections to analyze. Ensure full-body in frame and decent lighting."}
 
-    min_knee  = float(np.percentile(knee_angles, 10))
-    avg_torso = float(np.median(torso_angles))
-    max_valg  = float(np.percentile(knee_valgus_dev, 90)) if knee_valgus_dev else 0.0
-    max_dorsi = float(np.percentile(ankle_dorsi, 90))
+    min_knee  = knee_angles.value()
+    avg_torso = torso_angles.value()
+    max_valg  = knee_valgus_dev.value() if len(knee_valgus_dev) else 0.0
+    max_dorsi = ankle_dorsi.value()
 
     # --- scoring heuristics ---
     depth_score = 95 if min_knee <= 80 else 85 if min_knee <= 90 else 70 if min_knee <= 100 else 50
@@ -1,4 +1,5 @@
 import math
+from collections import namedtuple
 import numpy as np
 import mediapipe as mp
 
@@ -35,24 +36,97 @@ def dist_point_to_line(p, a, b):
         return None
     return float(np.linalg.norm(np.cross(ab, ap)) / denom)
 
+# ---------- Batch geometry ----------
+# Same formulas as above over (N, 2) point arrays, one row per frame.
+# Where the scalar version returns None the batch version gives NaN.
+def norms(v):
+    return np.sqrt(np.einsum("ij,ij->i", v, v))
+
+def angle_3pts_batch(a, b, c):
+    v1 = a - b
+    v2 = c - b
+    n1, n2 = norms(v1), norms(v2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosang = np.einsum("ij,ij->i", v1, v2) / (n1 * n2)
+    out = np.degrees(np.arccos(np.clip(cosang, -1.0, 1.0)))
+    out[(n1 == 0) | (n2 == 0)] = np.nan
+    return out
+
+def angle_to_vertical_batch(a, b):
+    v = a - b
+    n = norms(v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosang = v[:, 1] / n   # vertical unit vector (0, 1); image y grows downward
+    out = np.degrees(np.arccos(np.clip(cosang, -1.0, 1.0)))
+    out[n == 0] = np.nan
+    return out
+
+def dist_point_to_line_batch(p, a, b):
+    ap = p - a
+    ab = b - a
+    denom = norms(ab)
+    cross = ab[:, 0] * ap[:, 1] - ab[:, 1] * ap[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.abs(cross) / denom
+    out[denom == 0] = np.nan
+    return out
+
 # ---------- Landmarks ----------
-def lm_xy(landmarks, idx, w, h):
-    lm = landmarks[idx]
-    return (lm.x * w, lm.y * h)
-
-def choose_side_for_leg(landmarks):
-    left_vis = landmarks[L.LEFT_KNEE.value].visibility + landmarks[L.LEFT_HIP.value].visibility
-    right_vis = landmarks[L.RIGHT_KNEE.value].visibility + landmarks[L.RIGHT_HIP.value].visibility
-    return 'left' if left_vis >= right_vis else 'right'
-
-def choose_side_for_arm(landmarks):
-    left = (landmarks[L.LEFT_SHOULDER.value].visibility +
-            landmarks[L.LEFT_ELBOW.value].visibility +
-            landmarks[L.LEFT_WRIST.value].visibility)
-    right = (landmarks[L.RIGHT_SHOULDER.value].visibility +
-             landmarks[L.RIGHT_ELBOW.value].visibility +
-             landmarks[L.RIGHT_WRIST.value].visibility)
-    return 'left' if left >= right else 'right'
+N_LANDMARKS = 33
+
+# PoseLandmark indices of the joints the analyzers pick per side.
+SideJoints = namedtuple("SideJoints", "ear shoulder elbow wrist hip knee ankle heel foot_index")
+LEFT = SideJoints(*(L[f"LEFT_{name.upper()}"].value for name in SideJoints._fields))
+RIGHT = SideJoints(*(L[f"RIGHT_{name.upper()}"].value for name in SideJoints._fields))
+
+# NormalizedLandmarkList wire format: one length-delimited record per
+# landmark whose body is x, y, z, visibility [, presence], each a one-byte
+# tag followed by a little-endian float32. With all 33 records in that exact
+# layout the floats can be read straight out of the serialized bytes.
+_TAG_COLUMNS = ((0, b"\x0a"), (2, b"\x0d"), (7, b"\x15"), (12, b"\x1d"), (17, b"\x25"))
+
+def pose_array(landmarks, w=1, h=1, out=None):
+    """
+    res.pose_landmarks (or any sequence of landmarks) as a (33, 4) float32
+    array of [x * w, y * h, z, visibility]: pixel space for a w x h frame,
+    normalized with the defaults. Writes into `out` when given.
+    """
+    if out is None:
+        out = np.empty((N_LANDMARKS, 4), dtype=np.float32)
+    scale = np.array([w, h, 1, 1], dtype=np.float32)
+    buf = landmarks.SerializeToString() if hasattr(landmarks, "SerializeToString") else b""
+    rec, rem = divmod(len(buf), N_LANDMARKS)
+    if (rec in (22, 27) and not rem and buf[1::rec] == bytes([rec - 2]) * N_LANDMARKS
+            and all(buf[col::rec] == tag * N_LANDMARKS for col, tag in _TAG_COLUMNS)):
+        # 3 bytes of record header + tag precede x; fields are 5 bytes apart.
+        raw = np.ndarray((N_LANDMARKS, 4), dtype="<f4", buffer=buf, offset=3, strides=(rec, 5))
+        return np.multiply(raw, scale, out=out)
+    if hasattr(landmarks, "landmark"):
+        landmarks = landmarks.landmark
+    out[:] = [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks]
+    out *= scale
+    return out
+
+def landmarks_xy(lm):
+    """xy of pixel-space landmarks (..., 33, 4) as float64, the precision the geometry runs in."""
+    return lm[..., :2].astype(np.float64)
+
+def side_points(xy, left, left_idx, right_idx):
+    """(N, 2) points of landmark left_idx where `left` (bool (N,)) holds, else right_idx."""
+    return np.where(left[:, None], xy[:, left_idx], xy[:, right_idx])
+
+def choose_side_for_leg(lm):
+    """Side whose knee + hip are more visible: bool (...,) True = left, for landmarks (..., 33, 4)."""
+    vis = lm[..., 3].astype(np.float64)
+    return (vis[..., LEFT.knee] + vis[..., LEFT.hip] >=
+            vis[..., RIGHT.knee] + vis[..., RIGHT.hip])
+
+def choose_side_for_arm(lm):
+    """Side whose shoulder + elbow + wrist are more visible: bool (...,) True = left."""
+    vis = lm[..., 3].astype(np.float64)
+    left = vis[..., LEFT.shoulder] + vis[..., LEFT.elbow] + vis[..., LEFT.wrist]
+    right = vis[..., RIGHT.shoulder] + vis[..., RIGHT.elbow] + vis[..., RIGHT.wrist]
+    return left >= right
 
 # ---------- Pose factory ----------
 def make_pose():
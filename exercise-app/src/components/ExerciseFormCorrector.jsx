@@ -1,6 +1,33 @@
 import React, { useState, useRef } from "react";
 import axios from "axios";
 import ThemeToggle from "./ThemeToggle";
+import { extractPoseTrack } from "../poseTrack";
+import { makeProxyVideo } from "../proxyVideo";
+
+// Below this detection rate (after a few frames) the result won't be useful.
+const LOW_DETECTION_RATE = 0.5;
+const MIN_FRAMES_FOR_RATE = 15;
+
+const API = "http://localhost:5000";
+
+// Uploads up to this size are hashed first (X-Content-SHA256), so the server
+// can reuse or join an identical analysis before the last byte arrives.
+const HASH_MAX_BYTES = 256 * 1024 * 1024;
+
+const sha256Hex = async (file) => {
+  if (!crypto.subtle || file.size > HASH_MAX_BYTES) return null;
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) =>
+    b.toString(16).padStart(2, "0")
+  ).join("");
+};
+
+// Progress events from /api/analyze/stream arrive as one JSON object per line.
+const parseEvents = (text) =>
+  text
+    .split("\n")
+    .filter((line) => line.trim())
+    .map((line) => JSON.parse(line));
 
 const ExerciseFormCorrector = () => {
   const [videoFile, setVideoFile] = useState(null);
@@ -8,10 +35,15 @@ const ExerciseFormCorrector = () => {
   const [analysis, setAnalysis] = useState(null);
   const [loading, setLoading] = useState(false);
   const [uploadProgress, setUploadProgress] = useState(0);
+  const [liveProgress, setLiveProgress] = useState(null);
+  const [prepareProgress, setPrepareProgress] = useState(null);
   const [isDragging, setIsDragging] = useState(false);
   const videoRef = useRef(null);
   const fileInputRef = useRef(null);
   const videoUrlRef = useRef(null); // To store and clean up object URLs
+  const abortRef = useRef(null);
+  // X-Request-Id of the upload in flight, so the server can be told to stop.
+  const requestIdRef = useRef(null);
 
   const exercises = [
     { value: "squat", label: "Squat" },
@@ -89,38 +121,183 @@ const ExerciseFormCorrector = () => {
 
     setLoading(true);
     setUploadProgress(0);
+    setLiveProgress(null);
+    setAnalysis(null);
+
+    const controller = new AbortController();
+    abortRef.current = controller;
+
+    // Prefer extracting the pose here and sending only the landmarks; fall
+    // back to uploading the video when the browser can't run the model.
+    let track = null;
+    try {
+      track = await extractPoseTrack(videoFile, {
+        signal: controller.signal,
+        onProgress: ({ done, total, detected }) =>
+          setLiveProgress({
+            frames_processed: done,
+            frames_total: total,
+            detection_rate: detected / done,
+          }),
+      });
+    } catch (error) {
+      if (error.name === "AbortError") {
+        abortRef.current = null;
+        setLoading(false);
+        setLiveProgress(null);
+        return;
+      }
+      console.warn("On-device pose extraction unavailable:", error);
+      setLiveProgress(null);
+    }
+
+    if (track) {
+      try {
+        const response = await axios.post(
+          `${API}/api/analyze/landmarks`,
+          track.data.buffer,
+          {
+            params: {
+              exercise_type: exerciseType,
+              width: track.width,
+              height: track.height,
+            },
+            headers: { "Content-Type": "application/octet-stream" },
+            signal: controller.signal,
+          }
+        );
+        setAnalysis(response.data);
+      } catch (error) {
+        if (!axios.isCancel(error)) {
+          console.error("Analysis failed:", error);
+          alert(
+            error.response?.data?.error || "Analysis failed. Please try again."
+          );
+        }
+      } finally {
+        abortRef.current = null;
+        setLoading(false);
+        setLiveProgress(null);
+      }
+      return;
+    }
 
+    // Shrink large clips to a small proxy first; upload the original if the
+    // browser can't.
+    let upload = videoFile;
+    try {
+      setPrepareProgress(0);
+      upload = await makeProxyVideo(videoFile, {
+        signal: controller.signal,
+        onProgress: (fraction) => setPrepareProgress(Math.round(fraction * 100)),
+      });
+    } catch (error) {
+      if (error.name === "AbortError") {
+        abortRef.current = null;
+        setLoading(false);
+        setPrepareProgress(null);
+        return;
+      }
+      console.warn("Could not make a proxy video, uploading the original:", error);
+    } finally {
+      setPrepareProgress(null);
+    }
+
+    const requestId = crypto.randomUUID();
+    requestIdRef.current = requestId;
+    const sha256 = await sha256Hex(upload).catch(() => null);
     const formData = new FormData();
-    formData.append("video", videoFile);
+    // Fields go before the file so the backend can start analyzing a
+    // streamable video (WebM, MP4 with moov first) while it is still uploading.
     formData.append("exercise_type", exerciseType);
+    formData.append("video", upload);
 
     try {
       const response = await axios.post(
-        "http://localhost:5000/api/analyze",
+        `${API}/api/analyze/stream`,
         formData,
         {
           headers: {
             "Content-Type": "multipart/form-data",
+            "X-Request-Id": requestId,
+            ...(sha256 && { "X-Content-SHA256": sha256 }),
           },
+          responseType: "text",
+          signal: controller.signal,
           onUploadProgress: (progressEvent) => {
             const percentCompleted = Math.round(
               (progressEvent.loaded * 100) / progressEvent.total
             );
             setUploadProgress(percentCompleted);
           },
+          onDownloadProgress: (progressEvent) => {
+            const text = progressEvent.event?.target?.responseText;
+            if (!text) return;
+            const updates = parseEvents(
+              text.slice(0, text.lastIndexOf("\n") + 1)
+            ).filter((e) => e.event === "progress");
+            if (updates.length > 0) {
+              setLiveProgress(updates[updates.length - 1]);
+            }
+          },
         }
       );
 
-      setAnalysis(response.data);
+      const final = parseEvents(response.data).find(
+        (e) => e.event === "result"
+      );
+      if (!final || final.result.error) {
+        alert(final?.result.error || "Analysis failed. Please try again.");
+      } else {
+        setAnalysis(final.result);
+      }
     } catch (error) {
+      if (axios.isCancel(error)) return;
       console.error("Analysis failed:", error);
-      alert("Analysis failed. Please try again.");
+      alert(
+        error.response?.data?.error || "Analysis failed. Please try again."
+      );
     } finally {
+      abortRef.current = null;
+      requestIdRef.current = null;
       setLoading(false);
       setUploadProgress(0);
+      setLiveProgress(null);
+    }
+  };
+
+  // Closing the connection already stops the server-side analysis; the
+  // explicit cancel also gets through proxies that keep upstreams open.
+  const cancelOnServer = () => {
+    const requestId = requestIdRef.current;
+    if (!requestId) return;
+    requestIdRef.current = null;
+    navigator.sendBeacon(`${API}/api/analyze/cancel/${requestId}`);
+  };
+
+  const stopAnalysis = () => {
+    cancelOnServer();
+    if (abortRef.current) {
+      abortRef.current.abort();
     }
   };
 
+  // Leaving the page (or unmounting) mid-analysis shouldn't leave the
+  // server working on it.
+  React.useEffect(() => {
+    window.addEventListener("pagehide", cancelOnServer);
+    return () => {
+      window.removeEventListener("pagehide", cancelOnServer);
+      stopAnalysis();
+    };
+  }, []);
+
+  const lowDetection =
+    liveProgress &&
+    liveProgress.frames_processed >= MIN_FRAMES_FOR_RATE &&
+    liveProgress.detection_rate !== null &&
+    liveProgress.detection_rate < LOW_DETECTION_RATE;
+
   const getScoreColor = (score) => {
     if (score >= 80) return "text-green-600";
     if (score >= 60) return "text-yellow-600";
@@ -289,8 +466,23 @@ const ExerciseFormCorrector = () => {
             )}
           </button>
 
+          {/* Proxy Progress */}
+          {loading && prepareProgress !== null && (
+            <div className="mt-4">
+              <div className="w-full bg-gray-200 rounded-full h-2">
+                <div
+                  className="bg-blue-600 h-2 rounded-full transition-all duration-300"
+                  style={{ width: `${prepareProgress}%` }}
+                ></div>
+              </div>
+              <p className="text-sm text-gray-600 mt-1 text-center">
+                Preparing video: {prepareProgress}%
+              </p>
+            </div>
+          )}
+
           {/* Upload Progress */}
-          {loading && uploadProgress > 0 && (
+          {loading && uploadProgress > 0 && !liveProgress && (
             <div className="mt-4">
               <div className="w-full bg-gray-200 rounded-full h-2">
                 <div
@@ -303,6 +495,52 @@ const ExerciseFormCorrector = () => {
               </p>
             </div>
           )}
+
+          {/* Analysis Progress */}
+          {loading && liveProgress && (
+            <div className="mt-4">
+              {liveProgress.frames_total > 0 && (
+                <div className="w-full bg-gray-200 rounded-full h-2">
+                  <div
+                    className="bg-green-600 h-2 rounded-full transition-all duration-300"
+                    style={{
+                      width: `${Math.min(
+                        100,
+                        Math.round(
+                          (liveProgress.frames_processed * 100) /
+                            liveProgress.frames_total
+                        )
+                      )}%`,
+                    }}
+                  ></div>
+                </div>
+              )}
+              <p className="text-sm text-gray-600 dark:text-gray-300 mt-1 text-center">
+                Analyzed {liveProgress.frames_processed} frames
+                {liveProgress.detection_rate !== null &&
+                  ` · pose found in ${Math.round(
+                    liveProgress.detection_rate * 100
+                  )}%`}
+                {liveProgress.provisional?.overall_score !== undefined &&
+                  ` · provisional score ${liveProgress.provisional.overall_score}%`}
+              </p>
+              {lowDetection && (
+                <p className="text-sm text-amber-600 dark:text-amber-400 mt-2 text-center">
+                  Your body is rarely detected in this video. Check that
+                  your whole body is in frame and well lit. You can stop now
+                  and try another clip.
+                </p>
+              )}
+              <div className="text-center mt-2">
+                <button
+                  onClick={stopAnalysis}
+                  className="text-sm text-red-600 dark:text-red-400 underline hover:no-underline"
+                >
+                  Stop analysis
+                </button>
+              </div>
+            </div>
+          )}
         </div>
 
         {/* Analysis Results */}
@@ -323,6 +561,11 @@ const ExerciseFormCorrector = () => {
                 </span>
               </div>
               <p className="text-lg text-gray-600 mt-2">Overall Form Score</p>
+              {analysis.sampling?.truncated && (
+                <p className="text-sm text-yellow-700 mt-1">
+                  Long video: only the first part was analyzed.
+                </p>
+              )}
             </div>
 
             {/* What's Right */}
@@ -441,7 +684,7 @@ const ExerciseFormCorrector = () => {
                 <video
                   controls
                   className="w-full max-w-xl rounded-lg shadow-md"
-                  src={`http://localhost:5000${analysis.overlay_url}`}
+                  src={`${API}${analysis.overlay_url}`}
                 >
                   Your browser does not support the video tag.
                 </video>
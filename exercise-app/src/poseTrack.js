@@ -0,0 +1,121 @@
+// In-browser pose extraction for /api/analyze/landmarks: runs MediaPipe's
+// pose landmarker over a video file and packs the result as float32 samples
+// of 33 x [x, y, z, visibility] (normalized coordinates, NaN = no pose).
+// A clip's track is a few hundred KB instead of the whole video.
+
+// The wasm runtime must match the JS bundle: package.json pins the same
+// exact version, so bump both together.
+const TASKS_VISION_VERSION = "0.10.14";
+const WASM_URL = `https://cdn.jsdelivr.net/npm/@mediapipe/tasks-vision@${TASKS_VISION_VERSION}/wasm`;
+// Same "full" model the backend runs (model_complexity=1).
+const MODEL_URL =
+  "https://storage.googleapis.com/mediapipe-models/pose_landmarker/pose_landmarker_full/float16/1/pose_landmarker_full.task";
+
+export const N_LANDMARKS = 33;
+// The backend's SAMPLE_HZ; long clips are sampled more sparsely so they fit
+// in MAX_SAMPLES, like pipeline.sampling_stride.
+export const SAMPLE_FPS = 10;
+export const MAX_SAMPLES = 1800;
+
+let landmarkerPromise = null;
+let lastTimestamp = 0;
+
+const getLandmarker = () => {
+  if (!landmarkerPromise) {
+    landmarkerPromise = (async () => {
+      // Loaded on demand so the wasm runtime is only fetched when used.
+      const { FilesetResolver, PoseLandmarker } = await import(
+        "@mediapipe/tasks-vision"
+      );
+      const vision = await FilesetResolver.forVisionTasks(WASM_URL);
+      return PoseLandmarker.createFromOptions(vision, {
+        baseOptions: { modelAssetPath: MODEL_URL, delegate: "GPU" },
+        runningMode: "VIDEO",
+        numPoses: 1,
+      });
+    })();
+    // A failed load (no WebGL, offline) may succeed on a later attempt.
+    landmarkerPromise.catch(() => {
+      landmarkerPromise = null;
+    });
+  }
+  return landmarkerPromise;
+};
+
+const abortError = () => new DOMException("Aborted", "AbortError");
+
+const waitFor = (video, event, signal) =>
+  new Promise((resolve, reject) => {
+    const done = () => {
+      video.removeEventListener(event, done);
+      video.removeEventListener("error", fail);
+      resolve();
+    };
+    const fail = () => {
+      video.removeEventListener(event, done);
+      video.removeEventListener("error", fail);
+      reject(new Error("Could not decode video in the browser."));
+    };
+    if (signal?.aborted) return reject(abortError());
+    video.addEventListener(event, done);
+    video.addEventListener("error", fail);
+  });
+
+/**
+ * Extract a pose track from a video File.
+ * onProgress({ done, total, detected }) is called after every sample.
+ * Resolves to { data: Float32Array, samples, detected, width, height };
+ * rejects if the landmarker or the video cannot be loaded, or on abort.
+ */
+export const extractPoseTrack = async (
+  file,
+  { sampleFps = SAMPLE_FPS, maxSamples = MAX_SAMPLES, onProgress, signal } = {}
+) => {
+  const landmarker = await getLandmarker();
+  const url = URL.createObjectURL(file);
+  const video = document.createElement("video");
+  video.muted = true;
+  video.playsInline = true;
+  video.preload = "auto";
+  try {
+    video.src = url;
+    await waitFor(video, "loadeddata", signal);
+    const { videoWidth: width, videoHeight: height, duration } = video;
+    if (!width || !height || !Number.isFinite(duration)) {
+      throw new Error("Could not read video size or duration.");
+    }
+    // Widen the interval rather than cut the clip short once it would need
+    // more than maxSamples samples.
+    const interval = Math.max(1 / sampleFps, duration / maxSamples);
+    const total = Math.min(maxSamples, Math.floor(duration / interval) || 1);
+    const data = new Float32Array(total * N_LANDMARKS * 4).fill(NaN);
+    const base = lastTimestamp + 1000;
+    let detected = 0;
+
+    for (let i = 0; i < total; i++) {
+      if (signal?.aborted) throw abortError();
+      const seeked = waitFor(video, "seeked", signal);
+      video.currentTime = Math.min(i * interval, duration);
+      await seeked;
+      // VIDEO mode needs increasing timestamps across every clip it sees.
+      lastTimestamp = base + Math.round(i * interval * 1000);
+      const result = landmarker.detectForVideo(video, lastTimestamp);
+      const pose = result.landmarks?.[0];
+      if (pose && pose.length === N_LANDMARKS) {
+        detected++;
+        pose.forEach((lm, j) => {
+          data.set(
+            [lm.x, lm.y, lm.z, lm.visibility ?? 0],
+            (i * N_LANDMARKS + j) * 4
+          );
+        });
+      }
+      onProgress?.({ done: i + 1, total, detected });
+    }
+    return { data, samples: total, detected, width, height };
+  } finally {
+    video.removeAttribute("src");
+    video.load();
+    URL.revokeObjectURL(url);
+  }
+};
@@ -0,0 +1,113 @@
+// Low-resolution proxy of a video for upload: plays the file into a small
+// canvas and records that with MediaRecorder. Phone clips (4K, HEVC, tens of
+// MB) shrink to ~1 Mbit/s WebM at the size the backend runs inference at,
+// so uploading and decoding on the server both get much cheaper.
+
+// The backend downsizes frames to a 640 px long side (POSE_LONG_SIDE) before
+// inference, so pixels beyond that are never used.
+export const PROXY_LONG_SIDE = 640;
+// The backend only runs inference about 10 times a second (SAMPLE_HZ), so
+// frames beyond that are never looked at. Stay slightly above it so the
+// backend keeps every frame (stride 1) and a few dropped frames still leave
+// about 10 per second.
+export const PROXY_FPS = 12;
+export const PROXY_BITRATE = 1_000_000;
+// Files already this small are sent as they are.
+export const PROXY_MIN_BYTES = 4 * 1024 * 1024;
+
+const MIME_TYPES = ["video/webm;codecs=vp9", "video/webm;codecs=vp8", "video/webm"];
+
+export const proxySupported = () =>
+  typeof MediaRecorder !== "undefined" &&
+  typeof HTMLCanvasElement.prototype.captureStream === "function" &&
+  MIME_TYPES.some((t) => MediaRecorder.isTypeSupported(t));
+
+const abortError = () => new DOMException("Aborted", "AbortError");
+
+/**
+ * Resolve to a proxy File for `file`, or to `file` itself when no proxy is
+ * needed (already small) or would not be smaller. Rejects when the browser
+ * can't decode or record the video, or on abort; callers should then upload
+ * the original. onProgress(fraction) follows playback. Recording runs in real
+ * time, so this takes about as long as the clip.
+ */
+export const makeProxyVideo = async (
+  file,
+  { longSide = PROXY_LONG_SIDE, fps = PROXY_FPS, bitrate = PROXY_BITRATE,
+    minBytes = PROXY_MIN_BYTES, onProgress, signal } = {}
+) => {
+  if (file.size < minBytes) return file;
+  if (!proxySupported()) throw new Error("MediaRecorder/canvas capture unsupported.");
+  const mimeType = MIME_TYPES.find((t) => MediaRecorder.isTypeSupported(t));
+
+  const url = URL.createObjectURL(file);
+  const video = document.createElement("video");
+  video.muted = true;
+  video.playsInline = true;
+  video.preload = "auto";
+  let recorder = null;
+  let stopDrawing = () => {};
+  try {
+    video.src = url;
+    await new Promise((resolve, reject) => {
+      video.onloadedmetadata = resolve;
+      video.onerror = () => reject(new Error("Could not decode video in the browser."));
+    });
+    const { videoWidth: w, videoHeight: h } = video;
+    if (!w || !h) throw new Error("Could not read video size.");
+    const scale = Math.min(1, longSide / Math.max(w, h));
+    const canvas = document.createElement("canvas");
+    // Even dimensions keep the encoders happy.
+    canvas.width = Math.max(2, Math.round((w * scale) / 2) * 2);
+    canvas.height = Math.max(2, Math.round((h * scale) / 2) * 2);
+    const ctx = canvas.getContext("2d");
+
+    const chunks = [];
+    recorder = new MediaRecorder(canvas.captureStream(fps), {
+      mimeType,
+      videoBitsPerSecond: bitrate,
+    });
+    recorder.ondataavailable = (e) => e.data.size && chunks.push(e.data);
+    const stopped = new Promise((resolve) => (recorder.onstop = resolve));
+
+    // Draw every decoded frame; requestVideoFrameCallback where available.
+    let active = true;
+    const draw = () => {
+      if (!active) return;
+      ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+      if (video.duration) onProgress?.(Math.min(1, video.currentTime / video.duration));
+      if (video.requestVideoFrameCallback) video.requestVideoFrameCallback(draw);
+      else requestAnimationFrame(draw);
+    };
+    stopDrawing = () => {
+      active = false;
+    };
+
+    const finished = new Promise((resolve, reject) => {
+      video.onended = resolve;
+      video.onerror = () => reject(new Error("Video playback failed."));
+      signal?.addEventListener("abort", () => reject(abortError()), { once: true });
+    });
+    if (signal?.aborted) throw abortError();
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+    recorder.start(1000);
+    await video.play();
+    draw();
+    await finished;
+    stopDrawing();
+    recorder.stop();
+    await stopped;
+
+    const blob = new Blob(chunks, { type: "video/webm" });
+    if (!blob.size || blob.size >= file.size) return file;
+    const name = file.name.replace(/\.[^.]*$/, "") + ".proxy.webm";
+    return new File([blob], name, { type: "video/webm" });
+  } finally {
+    stopDrawing();
+    if (recorder && recorder.state !== "inactive") recorder.stop();
+    video.pause();
+    video.removeAttribute("src");
+    video.load();
+    URL.revokeObjectURL(url);
+  }
+};